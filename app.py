@@ -1,15 +1,11 @@
 import streamlit as st
-from gpt_infer import infer_user_profile
-from data.data_cleaner import clean_order_csv 
-import tempfile
-import os
+from gpt_infer import _PLACEHOLDER
+from jobs import ACTIVE, JobQueue, job_id_for, profile_upload
+from thumbnails import card_src
+from wordcloud_render import render_word_cloud_png
 import json
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud, STOPWORDS
 from collections import Counter
 import string
-import pandas as pd
-import re
 
 st.set_page_config(page_title="What Amazon Knows About You", layout="wide", page_icon="👤") 
 
@@ -22,6 +18,9 @@ COLOR_DARK_FOR_LIGHT_ACCENT = "#000000"
 COLOR_MATCH_GREEN_BG = "#DFF0D8" 
 COLOR_MATCH_GREEN_TEXT = "#3C763D" 
 
+PROMPT_CHAR_BUDGET = 8000
+JOB_POLL_SECONDS = 1.0
+
 page_bg_style = f"""
 <style>
 [data-testid="stAppViewContainer"] > .main {{
@@ -303,6 +302,164 @@ def get_comparison_display(key_name: str, self_val_raw, inferred_val_raw):
             
     return f"<div class='profile-attribute'><strong>{key_name.replace('_', ' ').capitalize()}:</strong> {self_val_display_processed}</div>"
 
+def render_profile_comparison(profile_data):
+    st.header("Profile Comparison")
+    
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown('<div class="comparison-column">', unsafe_allow_html=True)
+        st.subheader("Your Self-Perception")
+        self_data_to_display = st.session_state.self_profile_data
+        inferred_profile_map = profile_data.get("profile", {})
+
+        if any(val for val in self_data_to_display.values() if val): 
+            for key, self_value in self_data_to_display.items():
+                inferred_value = inferred_profile_map.get(key) 
+                comparison_html = get_comparison_display(key, self_value, inferred_value)
+                st.markdown(comparison_html, unsafe_allow_html=True)
+        else:
+            st.markdown("No self-perception data entered or all fields were 'Prefer not to say'")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with col2:
+        st.markdown('<div class="comparison-column">', unsafe_allow_html=True)
+        st.subheader("Profile Inferred from Your Data") 
+
+        inferred_profile = profile_data.get("profile")
+        if inferred_profile:
+            for key, value in inferred_profile.items():
+                display_value_inferred = ""
+                if isinstance(value, list):
+                    display_value_inferred = ", ".join(str(v) for v in value) if value else "<em>Not specified by AI</em>"
+                else:
+                    display_value_inferred = str(value) if value else "<em>Not specified by AI</em>"
+
+                st.markdown(f"<div class='profile-attribute'><strong>{key.capitalize()}:</strong> {display_value_inferred}</div>", unsafe_allow_html=True)
+        elif "error" in profile_data:
+             st.error(f"Could not display inferred profile. Error: {profile_data.get('error')}")
+             if profile_data.get("raw_response"):
+                st.expander("Raw GPT Response").code(profile_data.get("raw_response", ""), language="text")
+        else:
+            st.warning("No profile data was inferred, or the profile is empty.")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+
+def render_word_cloud(inferred_profile):
+    if not inferred_profile:
+        return
+    from wordcloud import STOPWORDS
+
+    stopwords_set = set(STOPWORDS)
+    custom_stops = {
+        "likely", "no", "yes", "unknown", "prefer not to say", "not specified", 
+        "na", "n a", "etc", "one", "two", "also", "may", "might", "often", "usually",
+        "age", "gender", "profession", "lifestyle", "personality", "hobbies", "shopping_style",
+        "style", "focused", "oriented", "conscious", "loyal", "buyer", "seeker", "follower", "edition"
+    }
+    stopwords_set.update(custom_stops)
+
+    keywords = []
+    for v_key, v_val in inferred_profile.items():
+        values_to_process = []
+        if isinstance(v_val, str):
+            if v_val.lower() not in custom_stops and v_val:
+                values_to_process.append(v_val)
+        elif isinstance(v_val, list):
+            for item_in_list in v_val:
+                if isinstance(item_in_list, str) and item_in_list.lower() not in custom_stops and item_in_list:
+                    values_to_process.append(item_in_list)
+
+        for text_item in values_to_process:
+            text_item_cleaned = text_item.lower().translate(str.maketrans("", "", string.punctuation))
+            words = text_item_cleaned.split()
+            for word in words:
+                if word not in stopwords_set and len(word) > 2:
+                    keywords.append(word)
+
+    if keywords:
+        st.header("Word Cloud from Inferred Profile Data") 
+        try:
+            tag_weights = dict(Counter(keywords))
+            if not tag_weights:
+                 st.caption("Not enough descriptive keywords to generate a word cloud.")
+            else: 
+                png = render_word_cloud_png(tag_weights, width=800, height=400, background_color=COLOR_WHITE,
+                                            colormap="viridis", min_font_size=10)
+                st.image(png, use_container_width=True)
+        except Exception as e:
+            st.caption(f"Could not generate word cloud: {e}")
+    else:
+        st.caption("Not enough descriptive keywords for a word cloud (after filtering common/category terms).")
+
+
+def render_recommendation_card(slot, rec):
+    name = rec.get("name", "N/A")
+    reason = rec.get("reason", "No reason provided.")
+    url = rec.get("url", "#")
+    img_url = card_src(rec.get("img"), _PLACEHOLDER)
+
+    slot.markdown(f"""
+    <div class="recommendation-card">
+        <img src="{img_url}" alt="{name}">
+        <div class="content">
+            <a href="{url}" target="_blank">{name}</a>
+            <p>{reason}</p>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+@st.cache_resource
+def get_job_queue():
+    # one worker pool per server process, shared by every session
+    return JobQueue()
+
+
+def render_job(job):
+    if job.get("order_lines") is not None:
+        compaction = job["compaction"]
+        st.success(f"Processed {job['order_lines']} relevant order lines from your file.")
+        if compaction:
+            st.caption(
+                f"Input text length for analysis: {compaction['compacted_chars']} characters "
+                f"(compacted from {compaction['original_chars']}, ~{compaction['compacted_tokens']} tokens)"
+            )
+        else:
+            st.caption(f"Input text length for analysis: {job['prompt_chars']} characters")
+    if job["status"] == "failed":
+        st.error(f"Error processing CSV: {job['error']}")
+        return
+
+    profile_data = job["result"] or {"profile": job.get("profile"), "recommendations": job.get("recommendations", [])}
+    if profile_data.get("error"):
+        render_profile_comparison(profile_data)
+        return
+    if profile_data.get("profile"):
+        render_profile_comparison(profile_data)
+        render_word_cloud(profile_data["profile"])
+    if profile_data.get("recommendations"):
+        st.header("Personalized Recommendations")
+        st.markdown("<em>Based on the inferred profile, here are some product suggestions.</em>")
+        for rec in profile_data["recommendations"]:
+            render_recommendation_card(st, rec)
+    if job["status"] == "done" and profile_data.get("profile"):
+        st.info("Full JSON response from the profiling model:")
+        st.expander("Click to expand full JSON").code(
+            json.dumps(profile_data, indent=2, ensure_ascii=False), language="json"
+        )
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_running_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job["status"] not in ACTIVE:
+        st.rerun()
+    stage = {"queued": "Waiting for a free worker...", "cleaning": "Processing your Amazon order history..."}
+    st.info(stage.get(job["stage"] or job["status"], "Analyzing data and inferring profile..."))
+    render_job(job)
+
+
 if not st.session_state.personal_info_saved:
     st.info("Please fill out and save your self-perception details in the sidebar to proceed.")
 else:
@@ -312,148 +469,35 @@ else:
     This helps illustrate how companies might build customer profiles based on purchase data.
     """)
     uploaded_file = st.file_uploader("Upload your Amazon Order CSV file:", type=["csv"])
+    job_queue = get_job_queue()
 
+    # kept server-side only: anyone holding a job id can read that job's profile
+    job_id = st.session_state.get("job_id")
+    upload_bytes = None
     if uploaded_file:
-        st.markdown("<div class='main-content-area'>", unsafe_allow_html=True) 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
-        st.info("Processing your Amazon order history...")
-        try:
-            prompt_text = clean_order_csv(tmp_path) 
-            os.remove(tmp_path)
-
-            st.success(f"Processed {len(prompt_text.splitlines())} relevant order lines from your file.")
-            st.caption(f"Input text length for analysis: {len(prompt_text)} characters")
-
-            if not prompt_text.strip():
-                st.error("The processed CSV file resulted in no data to analyze.")
+        upload_bytes = uploaded_file.getvalue()
+        job_id = job_id_for(upload_bytes, PROMPT_CHAR_BUDGET)
+        if st.session_state.get("job_id") != job_id:
+            # the same upload from another session or tab attaches to its running job
+            job_queue.submit(job_id, profile_upload, upload_bytes, max_prompt_chars=PROMPT_CHAR_BUDGET)
+            st.session_state.job_id = job_id
+
+    if job_id:
+        st.markdown("<div class='main-content-area'>", unsafe_allow_html=True)
+        job = job_queue.get(job_id)
+        if job is None:
+            st.warning("This analysis is no longer available. Please upload your file again.")
+        elif job["status"] in ACTIVE:
+            render_running_job(job_id)
+        else:
+            if job["status"] == "interrupted":
+                st.warning("The analysis was interrupted before it finished.")
             else:
-                with st.spinner("Analyzing data and inferring profile..."):
-                    profile_data = infer_user_profile(prompt_text) 
-
-                st.header("Profile Comparison")
-                
-                col1, col2 = st.columns(2)
-
-                with col1:
-                    st.markdown('<div class="comparison-column">', unsafe_allow_html=True)
-                    st.subheader("Your Self-Perception")
-                    self_data_to_display = st.session_state.self_profile_data
-                    inferred_profile_map = profile_data.get("profile", {})
-
-                    if any(val for val in self_data_to_display.values() if val): 
-                        for key, self_value in self_data_to_display.items():
-                            inferred_value = inferred_profile_map.get(key) 
-                            comparison_html = get_comparison_display(key, self_value, inferred_value)
-                            st.markdown(comparison_html, unsafe_allow_html=True)
-                    else:
-                        st.markdown("No self-perception data entered or all fields were 'Prefer not to say'")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown('<div class="comparison-column">', unsafe_allow_html=True)
-                    st.subheader("Profile Inferred from Your Data") 
-                    
-                    inferred_profile = profile_data.get("profile")
-                    if inferred_profile:
-                        for key, value in inferred_profile.items():
-                            display_value_inferred = ""
-                            if isinstance(value, list):
-                                display_value_inferred = ", ".join(str(v) for v in value) if value else "<em>Not specified by AI</em>"
-                            else:
-                                display_value_inferred = str(value) if value else "<em>Not specified by AI</em>"
-                            
-                            st.markdown(f"<div class='profile-attribute'><strong>{key.capitalize()}:</strong> {display_value_inferred}</div>", unsafe_allow_html=True)
-                    elif "error" in profile_data:
-                         st.error(f"Could not display inferred profile. Error: {profile_data.get('error')}")
-                         if profile_data.get("raw_response"):
-                            st.expander("Raw GPT Response").code(profile_data.get("raw_response", ""), language="text")
-                    else:
-                        st.warning("No profile data was inferred, or the profile is empty.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                if "profile" in profile_data and profile_data["profile"]:
-                    stopwords_set = set(STOPWORDS)
-                    custom_stops = {
-                        "likely", "no", "yes", "unknown", "prefer not to say", "not specified", 
-                        "na", "n a", "etc", "one", "two", "also", "may", "might", "often", "usually",
-                        "age", "gender", "profession", "lifestyle", "personality", "hobbies", "shopping_style",
-                        "style", "focused", "oriented", "conscious", "loyal", "buyer", "seeker", "follower", "edition"
-                    }
-                    stopwords_set.update(custom_stops)
-                    
-                    keywords = []
-                    for v_key, v_val in profile_data["profile"].items():
-                        values_to_process = []
-                        if isinstance(v_val, str):
-                            if v_val.lower() not in custom_stops and v_val:
-                                values_to_process.append(v_val)
-                        elif isinstance(v_val, list):
-                            for item_in_list in v_val:
-                                if isinstance(item_in_list, str) and item_in_list.lower() not in custom_stops and item_in_list:
-                                    values_to_process.append(item_in_list)
-                        
-                        for text_item in values_to_process:
-                            text_item_cleaned = text_item.lower().translate(str.maketrans("", "", string.punctuation))
-                            words = text_item_cleaned.split()
-                            for word in words:
-                                if word not in stopwords_set and len(word) > 2:
-                                    keywords.append(word)
-                    
-                    if keywords:
-                        st.header("Word Cloud from Inferred Profile Data") 
-                        try:
-                            tag_weights = dict(Counter(keywords))
-                            if not tag_weights:
-                                 st.caption("Not enough descriptive keywords to generate a word cloud.")
-                            else: 
-                                wc = WordCloud(width=800, height=400, background_color=COLOR_WHITE, 
-                                               stopwords=stopwords_set, collocations=True, 
-                                               colormap="viridis", min_font_size=10) 
-                                wc.generate_from_frequencies(tag_weights)
-                                fig, ax = plt.subplots()
-                                ax.imshow(wc, interpolation='bilinear')
-                                ax.axis("off")
-                                fig.patch.set_facecolor(COLOR_BACKGROUND) 
-                                st.pyplot(fig)
-                        except Exception as e:
-                            st.caption(f"Could not generate word cloud: {e}")
-                    else:
-                        st.caption("Not enough descriptive keywords for a word cloud (after filtering common/category terms).")
-
-                if "recommendations" in profile_data and profile_data["recommendations"]:
-                    st.header("Personalized Recommendations") 
-                    st.markdown("<em>Based on the inferred profile, here are some product suggestions.</em>")
-
-                    for rec in profile_data["recommendations"]:
-                        name = rec.get("name", "N/A")
-                        reason = rec.get("reason", "No reason provided.")
-                        url = rec.get("url", "#")
-                        img_url = rec.get("img") or "https://via.placeholder.com/120?text=No+Image+Available"
-
-                        st.markdown(f"""
-                        <div class="recommendation-card">
-                            <img src="{img_url}" alt="{name}">
-                            <div class="content">
-                                <a href="{url}" target="_blank">{name}</a>
-                                <p>{reason}</p>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                
-                if profile_data.get("profile"): 
-                    st.info("Full JSON response from the profiling model:")
-                    st.expander("Click to expand full JSON").code(
-                        json.dumps(profile_data, indent=2, ensure_ascii=False), language="json"
-                    )
-        except ValueError as e:
-            st.error(f"Error processing CSV: {e}")
-        except Exception as e:
-            st.error(f"An unexpected error occurred: {e}")
-        finally:
-            if 'tmp_path' in locals() and os.path.exists(tmp_path): 
-                 os.remove(tmp_path) 
-        st.markdown("</div>", unsafe_allow_html=True) 
-    
\ No newline at end of file
+                render_job(job)
+            failed = job["status"] in ("failed", "interrupted") or (job["result"] or {}).get("error")
+            if failed and upload_bytes is not None and st.button("Try again"):
+                job_queue.submit(job_id, profile_upload, upload_bytes, max_prompt_chars=PROMPT_CHAR_BUDGET)
+                st.rerun()
+            elif failed and upload_bytes is None:
+                st.caption("Upload the file again to retry.")
+        st.markdown("</div>", unsafe_allow_html=True)
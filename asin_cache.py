@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os, re, sqlite3, threading, time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 50_000
+# a hit only rewrites last_used once it's this stale, so warm lookups stay read-only
+TOUCH_INTERVAL = 3600
+BUSY_TIMEOUT_S = 5.0
+
+
+def normalize_product_name(name: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", name.casefold()).split())
+
+
+class AsinCache:
+    """SQLite-backed map of normalized product name -> /dp/ASIN url (None for misses)."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # batch workers share the file: WAL lets readers run alongside a writer, and a writer waits its turn
+            self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS asin_cache ("
+                " key TEXT PRIMARY KEY, url TEXT, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS asin_cache_last_used ON asin_cache (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, name: str) -> Tuple[bool, Optional[str]]:
+        key = normalize_product_name(name)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT url, expires_at, last_used FROM asin_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    db.execute("DELETE FROM asin_cache WHERE key = ?", (key,))
+                    db.commit()
+                self.misses += 1
+                return False, None
+            if now - row[2] >= TOUCH_INTERVAL:
+                db.execute("UPDATE asin_cache SET last_used = ? WHERE key = ?", (now, key))
+                db.commit()
+            if row[0] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, row[0]
+
+    def put(self, name: str, url: Optional[str]) -> None:
+        key = normalize_product_name(name)
+        now = time.time()
+        expires_at = now + (self.ttl if url else self.negative_ttl)
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO asin_cache (key, url, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, url, expires_at, now),
+            )
+            overflow = db.execute("SELECT COUNT(*) FROM asin_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                db.execute(
+                    "DELETE FROM asin_cache WHERE key IN "
+                    "(SELECT key FROM asin_cache ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+            db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM asin_cache")
+            self._db().commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = self._db().execute("SELECT COUNT(*) FROM asin_cache").fetchone()[0]
+        return {"hits": self.hits, "negative_hits": self.negative_hits, "misses": self.misses, "size": size}
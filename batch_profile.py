@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import argparse, glob, json, multiprocessing, os, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Set
+
+from data.prompt_compactor import compact_prompt
+from metrics import registry, span
+
+
+def collect_inputs(patterns: Iterable[str]) -> List[str]:
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*.csv"), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(os.path.abspath(p) for p in matches if os.path.isfile(p))
+    return sorted(set(paths))
+
+
+def load_checkpoint(output_path: str, retry_errors: bool = False) -> Set[str]:
+    if not os.path.exists(output_path):
+        return set()
+    latest: Dict[str, str] = {}
+    dropped = False
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped = True  # torn last line from a crashed run
+                continue
+            path = record.get("file")
+            dropped |= path in latest
+            latest.pop(path, None)
+            if retry_errors and record.get("status") != "ok":
+                dropped = True
+                continue
+            latest[path] = line if line.endswith("\n") else line + "\n"
+    if dropped:
+        # one record per file, so a retried file doesn't leave its old error behind
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(latest.values())
+        os.replace(tmp_path, output_path)
+    return set(latest)
+
+
+def _clean(path: str, max_prompt_chars: Optional[int] = None, rules: bool = False) -> Dict:
+    from data.data_cleaner import clean_order_csv
+
+    # runs in a pool process: ship this file's spans back for the parent to merge
+    registry.reset()
+    start = time.perf_counter()
+    try:
+        prompt = clean_order_csv(path)
+        provisional = None
+        if rules:
+            # on the order lines themselves; the rules can't read compacted ones
+            from rule_profiler import provisional_profile
+            with span("rule_profile"):
+                provisional = provisional_profile(prompt)
+        compaction = None
+        if max_prompt_chars:
+            with span("prompt_compact"):
+                prompt, compaction = compact_prompt(prompt, max_chars=max_prompt_chars)
+    except Exception as e:
+        # returned rather than raised so a failing file's spans still reach the parent
+        return {"error": f"Error processing CSV: {e}", "clean_s": time.perf_counter() - start,
+                "metrics": registry.snapshot()}
+    return {"prompt": prompt, "compaction": compaction, "provisional": provisional,
+            "clean_s": time.perf_counter() - start, "metrics": registry.snapshot()}
+
+
+def _infer(prompt: str, rules_threshold: Optional[float] = None, provisional: Optional[Dict] = None) -> Dict:
+    start = time.perf_counter()
+    if rules_threshold is None:
+        from gpt_infer import infer_user_profile
+        data = infer_user_profile(prompt)
+    else:
+        from rule_profiler import profile_with_rules
+        data = profile_with_rules(prompt, threshold=rules_threshold, provisional=provisional)
+    return {"data": data, "llm_s": time.perf_counter() - start}
+
+
+def run_batch(paths: List[str], output_path: str, workers: int = os.cpu_count() or 1,
+              llm_concurrency: int = 4, retry_errors: bool = False,
+              max_prompt_chars: Optional[int] = None, rules_threshold: Optional[float] = None) -> Dict[str, int]:
+    done = load_checkpoint(output_path, retry_errors)
+    todo = [p for p in paths if p not in done]
+    counts = {"skipped": len(paths) - len(todo), "ok": 0, "error": 0}
+    if not todo:
+        return counts
+
+    started = {}
+    cleaned = {}
+    pending_clean = {}
+    pending_llm = {}
+    queue = list(reversed(todo))
+    max_cleaned_ahead = max(workers, llm_concurrency) * 2
+
+    # spawned, not forked: a replacement pool is started while the LLM threads are running
+    mp_context = multiprocessing.get_context("spawn")
+    clean_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    try:
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=llm_concurrency) as llm_pool:
+
+            def write(path: str, record: Dict) -> None:
+                record = {"file": path, **record}
+                record["timings"]["total_s"] = time.perf_counter() - started[path]
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+                registry.inc("batch_files_total", status=record["status"])
+
+            def submit_clean(path: str) -> None:
+                nonlocal clean_pool
+                try:
+                    fut = clean_pool.submit(_clean, path, max_prompt_chars, rules_threshold is not None)
+                except BrokenProcessPool:
+                    # a worker died (OOM, segfault); its in-flight files are recorded as errors
+                    clean_pool.shutdown(wait=False)
+                    clean_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+                    fut = clean_pool.submit(_clean, path, max_prompt_chars, rules_threshold is not None)
+                pending_clean[fut] = path
+
+            while queue or pending_clean or pending_llm:
+                # keep the LLM dispatcher fed without cleaning the whole directory ahead of it
+                while queue and len(pending_clean) + len(pending_llm) < max_cleaned_ahead:
+                    path = queue.pop()
+                    started[path] = time.perf_counter()
+                    submit_clean(path)
+
+                finished, _ = wait(list(pending_clean) + list(pending_llm), return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    if fut in pending_clean:
+                        path = pending_clean.pop(fut)
+                        try:
+                            result = fut.result()
+                        except BrokenProcessPool as e:
+                            write(path, {"status": "error", "error": f"Cleaning worker crashed: {e}", "timings": {}})
+                            continue
+                        except Exception as e:
+                            write(path, {"status": "error", "error": f"Error processing CSV: {e}", "timings": {}})
+                            continue
+                        registry.merge(result.pop("metrics"))
+                        if "error" in result:
+                            write(path, {"status": "error", "error": result["error"],
+                                         "timings": {"clean_s": result["clean_s"]}})
+                            continue
+                        if not result["prompt"].strip():
+                            write(path, {"status": "error", "error": "The processed CSV file resulted in no data to analyze.",
+                                         "timings": {"clean_s": result["clean_s"]}})
+                            continue
+                        cleaned[path] = result
+                        pending_llm[llm_pool.submit(_infer, result["prompt"], rules_threshold,
+                                                      result["provisional"])] = path
+                    else:
+                        path = pending_llm.pop(fut)
+                        clean_result = cleaned.pop(path)
+                        timings = {"clean_s": clean_result["clean_s"]}
+                        try:
+                            result = fut.result()
+                        except Exception as e:
+                            write(path, {"status": "error", "error": f"Profiling failed: {e}", "timings": timings})
+                            continue
+                        data = result["data"]
+                        timings["llm_s"] = result["llm_s"]
+                        write(path, {
+                            "status": "error" if data.get("error") else "ok",
+                            "error": data.get("error"),
+                            "order_lines": len(clean_result["prompt"].splitlines()),
+                            "prompt_chars": len(clean_result["prompt"]),
+                            "compaction": clean_result["compaction"],
+                            "profile": data.get("profile", {}),
+                            "recommendations": data.get("recommendations", []),
+                            "llm": data.get("provisional", {}).get("llm", "full"),
+                            "timings": timings,
+                        })
+    finally:
+        clean_pool.shutdown()
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile a directory or glob of Amazon order CSV exports.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="profiles.jsonl", help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="processes for CSV cleaning")
+    parser.add_argument("-c", "--llm-concurrency", type=int, default=4, help="concurrent LLM requests")
+    parser.add_argument("--max-prompt-chars", type=int, default=None,
+                        help="compact each prompt to this many characters before the LLM call")
+    parser.add_argument("--retry-errors", action="store_true", help="re-run files whose previous record is an error")
+    parser.add_argument("--rules-threshold", type=float, default=None,
+                        help="run the rule-based profiler first; traits clearing this confidence go to the LLM as settled, "
+                             "and no LLM call is made if lifestyle, hobbies and shopping_style all do")
+    parser.add_argument("--metrics", help="write per-stage metrics here (.json, otherwise Prometheus text)")
+    parser.add_argument("--store", help="also write the profiles in the output file to this columnar store directory")
+    args = parser.parse_args(argv)
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("No CSV files matched.", file=sys.stderr)
+        return 1
+    counts = run_batch(paths, args.output, args.workers, args.llm_concurrency, args.retry_errors,
+                       args.max_prompt_chars, args.rules_threshold)
+    if args.metrics:
+        registry.dump(args.metrics)
+    if args.store:
+        from profile_store import ProfileStore
+        ProfileStore.from_jsonl(args.output).save(args.store)
+    print(f"{counts['ok']} profiled, {counts['error']} failed, {counts['skipped']} already done -> {args.output}")
+    return 0 if counts["error"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Profiles per second for many concurrent users: sequential, thread pool and asyncio.
+
+    python bench/bench_async.py --users 200 --concurrency 50 --llm-latency 1.5
+
+Each user gets a distinct prompt so the result cache never answers. The
+LLM and lookup latencies come from bench/stubs.py (or --replay), so the
+numbers measure how well each mode overlaps waiting, not the model.
+"""
+from __future__ import annotations
+
+import argparse, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+MODES = ["sequential", "threads", "async"]
+
+
+def _prompts(users: int) -> List[str]:
+    return [f"2024-01-01: Stub order for user {i} ($9.99)" for i in range(users)]
+
+
+def run_mode(mode: str, users: int, concurrency: int, opts: Dict) -> Dict:
+    import gpt_infer, gpt_infer_async
+    from bench import stubs
+
+    if opts.get("replay"):
+        from replay import ReplayTransport
+        from scheduler import LookupScheduler
+        gpt_infer._transport = ReplayTransport("replay", opts["replay"], opts["replay_latency"])
+        gpt_infer._scheduler = LookupScheduler(opts["rate_limits"])
+        restore = lambda: None
+    elif mode == "async":
+        restore = stubs.install_async(gpt_infer_async, opts["llm_latency"], opts["dp_latency"], opts["thumb_latency"],
+                                      opts["jitter"])
+    else:
+        restore = stubs.install(gpt_infer, opts["llm_latency"], opts["dp_latency"], opts["thumb_latency"], opts["jitter"])
+
+    prompts = _prompts(users)
+    try:
+        start = time.perf_counter()
+        if mode == "sequential":
+            results = [gpt_infer.infer_user_profile(p, use_cache=False) for p in prompts]
+        elif mode == "threads":
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(lambda p: gpt_infer.infer_user_profile(p, use_cache=False), prompts))
+        else:
+            results = gpt_infer_async.infer_user_profiles(prompts, concurrency=concurrency, use_cache=False)
+        elapsed = time.perf_counter() - start
+    finally:
+        restore()
+    errors = sum(1 for r in results if r.get("error"))
+    result = {"mode": mode, "users": users, "concurrency": concurrency, "seconds": elapsed,
+              "profiles_per_s": users / elapsed, "errors": errors}
+    if opts.get("replay"):
+        result["lookups"] = gpt_infer._get_scheduler().stats()
+    return result
+
+
+def main(argv=None) -> int:
+    import warnings
+    warnings.simplefilter("ignore")
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per stubbed chat completion")
+    parser.add_argument("--dp-latency", type=float, default=0.3, help="seconds per stubbed ASIN lookup")
+    parser.add_argument("--thumb-latency", type=float, default=0.2, help="seconds per stubbed thumbnail lookup")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--replay", help="serve OpenAI/DuckDuckGo/Unsplash from this recorded archive instead of stubs")
+    parser.add_argument("--replay-latency", default="recorded", help="latency profile for --replay, see replay.py")
+    parser.add_argument("--rate-limits", default="off", help="lookup rate limits for --replay, see scheduler.py")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    opts = {k: getattr(args, k) for k in ("llm_latency", "dp_latency", "thumb_latency", "jitter",
+                                       "replay", "replay_latency", "rate_limits")}
+    results = []
+    for mode in args.modes:
+        # sequential would take users x latency; a slice of them gives the same rate
+        users = min(args.users, max(1, args.concurrency // 10)) if mode == "sequential" else args.users
+        r = run_mode(mode, users, args.concurrency, opts)
+        results.append(r)
+        print(f"{r['mode']:<11} {r['users']:>6} users  {r['seconds']:8.2f} s  {r['profiles_per_s']:8.1f} profiles/s"
+              f"  errors {r['errors']}", flush=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": opts, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
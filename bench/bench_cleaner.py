@@ -0,0 +1,83 @@
+"""clean_order_csv against the version at a git revision: same output, and how much faster.
+
+    python bench/bench_cleaner.py --baseline 5a7ee54~1 --sizes 10000 100000
+
+Exits non-zero if any output differs, streamed or not.
+"""
+from __future__ import annotations
+
+import argparse, importlib.util, os, subprocess, sys, tempfile, time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# the tree before the vectorized address and line formatting
+DEFAULT_BASELINE = "5a7ee54~1"
+
+
+def load_baseline(rev: str):
+    source = subprocess.run(["git", "show", f"{rev}:data/data_cleaner.py"], cwd=REPO_ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    # older revisions sorted same-day rows unstably, i.e. in an order the current cleaner can't reproduce
+    source = source.replace("sort_values(by='Order Date')\n", "sort_values(by='Order Date', kind='stable')\n")
+    path = os.path.join(tempfile.mkdtemp(), "baseline_data_cleaner.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_data_cleaner", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _best_of(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def compare(baseline, csv_path: str, rows: int, repeat: int) -> Dict:
+    from data import data_cleaner
+
+    old_s, old = _best_of(lambda: baseline.clean_order_csv(csv_path), repeat)
+    new_s, new = _best_of(lambda: data_cleaner.clean_order_csv(csv_path), repeat)
+    # against the baseline's full clean, which every revision has (iter_order_lines came later)
+    streamed_same = list(data_cleaner.iter_order_lines(csv_path)) == old.splitlines()
+    return {"rows": rows, "baseline_s": old_s, "current_s": new_s, "speedup": old_s / new_s,
+            "identical": old == new and streamed_same}
+
+
+def main(argv=None) -> int:
+    import warnings
+    warnings.simplefilter("ignore")
+    from data.synth_orders import generate_orders_csv
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="git revision to compare against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--workdir", default=os.path.join(REPO_ROOT, ".cache", "bench"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    os.makedirs(args.workdir, exist_ok=True)
+    results: List[Dict] = []
+    for rows in args.sizes:
+        csv_path = os.path.join(args.workdir, f"orders_{rows}_{args.seed}.csv")
+        if not os.path.exists(csv_path):
+            generate_orders_csv(csv_path, rows, seed=args.seed)
+        r = compare(baseline, csv_path, rows, args.repeat)
+        results.append(r)
+        print(f"{rows:>10,}  baseline {r['baseline_s']:8.3f} s  current {r['current_s']:8.3f} s"
+              f"  x{r['speedup']:5.2f}  {'identical' if r['identical'] else 'DIFFERENT'}", flush=True)
+    return 0 if all(r["identical"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Throughput, latency percentiles and peak memory per pipeline stage across export sizes.
+
+    python bench/bench_pipeline.py --sizes 1000 10000 100000 1000000 --json bench.json
+
+Every (size, stage) cell runs in a fresh process so peak RSS belongs to that
+stage alone. OpenAI, DuckDuckGo and Unsplash are replaced by bench/stubs.py
+with the latencies given on the command line, or with --replay by an archive
+recorded through replay.py (REPLAY_MODE=record) and its latency profile.
+"""
+from __future__ import annotations
+
+import argparse, json, multiprocessing, os, resource, statistics, sys, time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+STAGES = ["clean", "stream", "compact", "validate", "fix_recs", "infer"]
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {"p50_ms": pick(0.50) * 1000, "p95_ms": pick(0.95) * 1000, "p99_ms": pick(0.99) * 1000,
+            "mean_ms": statistics.fmean(ordered) * 1000}
+
+
+def _timed(fn, iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _run_stage(stage: str, csv_path: str, rows: int, opts: Dict, prompt: str = "") -> Dict:
+    import warnings
+    warnings.simplefilter("ignore")
+
+    import gpt_infer
+    from bench import stubs
+    from data.data_cleaner import clean_order_csv, iter_order_lines
+    from data.prompt_compactor import compact_prompt
+
+    if opts.get("replay"):
+        from replay import ReplayTransport
+        from scheduler import LookupScheduler
+        gpt_infer._transport = ReplayTransport("replay", opts["replay"], opts["replay_latency"])
+        gpt_infer._scheduler = LookupScheduler(opts["rate_limits"])
+    else:
+        stubs.install(gpt_infer, opts["llm_latency"], opts["dp_latency"], opts["thumb_latency"], opts["jitter"])
+    result: Dict = {"stage": stage, "rows": rows}
+
+    if stage in ("clean", "stream"):
+        start = time.perf_counter()
+        if stage == "clean":
+            lines = len(clean_order_csv(csv_path).splitlines())
+        else:
+            lines = sum(1 for _ in iter_order_lines(csv_path))
+        elapsed = time.perf_counter() - start
+        result.update(seconds=elapsed, rows_per_s=rows / elapsed, order_lines=lines)
+    else:
+        if stage == "compact":
+            samples = _timed(lambda: compact_prompt(prompt, max_chars=opts["prompt_chars"]), opts["iterations"])
+            result["compaction"] = compact_prompt(prompt, max_chars=opts["prompt_chars"])[1]
+        elif stage == "validate":
+            reply = stubs.stub_reply()
+            samples = _timed(lambda: gpt_infer._validate_profile(gpt_infer._parse_reply(reply)["profile"]),
+                             opts["iterations"] * 100)
+        elif stage == "fix_recs":
+            samples = _timed(lambda: gpt_infer._fix_recs(json.loads(stubs.stub_reply())["recommendations"]),
+                             opts["iterations"])
+        else:
+            compacted = compact_prompt(prompt, max_chars=opts["prompt_chars"])[0]
+            samples = _timed(lambda: gpt_infer.infer_user_profile(compacted, use_cache=False), opts["iterations"])
+        result.update(percentiles(samples))
+        result["ops_per_s"] = len(samples) / sum(samples) if sum(samples) else float("inf")
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _stage_in_child(args):
+    return _run_stage(*args)
+
+
+def run(sizes: List[int], stages: List[str], workdir: str, opts: Dict, seed: int = 0) -> List[Dict]:
+    import warnings
+    warnings.simplefilter("ignore")
+    from data.data_cleaner import clean_order_csv
+    from data.synth_orders import generate_orders_csv
+
+    os.makedirs(workdir, exist_ok=True)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for rows in sizes:
+        csv_path = os.path.join(workdir, f"orders_{rows}_{seed}.csv")
+        if not os.path.exists(csv_path):
+            generate_orders_csv(csv_path, rows, seed=seed)
+        # cleaned once here so the later stages' peak RSS is their own
+        prompt = clean_order_csv(csv_path) if {"compact", "infer"} & set(stages) else ""
+        for stage in stages:
+            stage_prompt = prompt if stage in ("compact", "infer") else ""
+            with ctx.Pool(1) as pool:
+                result = pool.apply(_stage_in_child, ((stage, csv_path, rows, opts, stage_prompt),))
+            results.append(result)
+            _print_row(result)
+    return results
+
+
+def _print_row(r: Dict) -> None:
+    if "rows_per_s" in r:
+        detail = f"{r['seconds']:8.2f} s  {r['rows_per_s']:12,.0f} rows/s"
+    else:
+        detail = f"p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms"
+    print(f"{r['rows']:>10,} {r['stage']:<9} {detail}  peak {r['peak_rss_mb']:8.1f} MB", flush=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--workdir", default=os.path.join(REPO_ROOT, ".cache", "bench"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--prompt-chars", type=int, default=8000)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per stubbed chat completion")
+    parser.add_argument("--dp-latency", type=float, default=0.0, help="seconds per stubbed ASIN lookup")
+    parser.add_argument("--thumb-latency", type=float, default=0.0, help="seconds per stubbed thumbnail lookup")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--replay", help="serve OpenAI/DuckDuckGo/Unsplash from this recorded archive instead of stubs")
+    parser.add_argument("--replay-latency", default="recorded", help="latency profile for --replay, see replay.py")
+    parser.add_argument("--rate-limits", default="off", help="lookup rate limits for --replay, see scheduler.py")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    opts = {k: getattr(args, k) for k in ("iterations", "prompt_chars", "llm_latency", "dp_latency", "thumb_latency", "jitter",
+                                       "replay", "replay_latency", "rate_limits")}
+    results = run(args.sizes, args.stages, args.workdir, opts, args.seed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": opts, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
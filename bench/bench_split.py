@@ -0,0 +1,123 @@
+"""Time to profile and to the full result: one combined LLM call vs split_infer's two calls.
+
+    python bench/bench_split.py --requests 200 --tail-prob 0.05 --hedge-after 0.5
+
+The stubbed model's latency grows with its reply length, and ``--tail-prob`` of calls are slow.
+"""
+from __future__ import annotations
+
+import argparse, json, os, random, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench.bench_pipeline import percentiles
+
+MODES = ["combined", "parallel", "conditioned"]
+
+
+class SizedLatencyCompletions:
+    """Chat stub that answers whichever of profile/recommendations the system prompt asks for."""
+
+    def __init__(self, base: float, per_char: float, tail_prob: float, tail_factor: float, seed: int = 0):
+        from bench.stubs import STUB_PROFILE, STUB_RECS
+
+        self.replies = {
+            "combined": json.dumps({"profile": STUB_PROFILE, "recommendations": STUB_RECS}),
+            "profile": json.dumps({"profile": STUB_PROFILE}),
+            "recommendations": json.dumps({"recommendations": STUB_RECS}),
+        }
+        self.base, self.per_char = base, per_char
+        self.tail_prob, self.tail_factor = tail_prob, tail_factor
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        system = kwargs["messages"][0]["content"]
+        if "'profile' and 'recommendations'" in system:
+            reply = self.replies["combined"]
+        elif "'recommendations' key" in system:
+            reply = self.replies["recommendations"]
+        else:
+            reply = self.replies["profile"]
+        with self._lock:
+            slow = self._rng.random() < self.tail_prob
+        time.sleep((self.base + self.per_char * len(reply)) * (self.tail_factor if slow else 1.0))
+        if kwargs.get("stream"):
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=reply))])])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+def _one(mode: str, prompt: str, hedge_after) -> Dict[str, float]:
+    import gpt_infer
+    from split_infer import stream_user_profile_split
+
+    start = time.perf_counter()
+    if mode == "combined":
+        events = gpt_infer.stream_user_profile(prompt, use_cache=False)
+    else:
+        events = stream_user_profile_split(prompt, mode, hedge_after, use_cache=False)
+    out = {}
+    for event in events:
+        if event["event"] == "profile":
+            out["profile"] = time.perf_counter() - start
+        elif event["event"] == "done":
+            out["full"] = time.perf_counter() - start
+    return out
+
+
+def run(modes: List[str], requests: int, concurrency: int, hedge_after, opts: Dict) -> List[Dict]:
+    import gpt_infer
+    from bench import stubs
+
+    restore = stubs.install(gpt_infer)
+    gpt_infer.client = SimpleNamespace(chat=SimpleNamespace(completions=SizedLatencyCompletions(
+        opts["base_latency"], opts["per_char"], opts["tail_prob"], opts["tail_factor"], opts["seed"])))
+    results = []
+    try:
+        for mode in modes:
+            for hedge in ([None] if mode == "combined" or not hedge_after else [None, hedge_after]):
+                prompts = [f"2024-01-01: Stub order {i} ($9.99)" for i in range(requests)]
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    samples = list(pool.map(lambda p: _one(mode, p, hedge), prompts))
+                label = mode if hedge is None else f"{mode}+hedge@{hedge:g}s"
+                for path in ("profile", "full"):
+                    r = {"mode": label, "path": path, **percentiles([s[path] for s in samples])}
+                    results.append(r)
+                    print(f"{label:<24} {path:<8} p50 {r['p50_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms", flush=True)
+    finally:
+        restore()
+    return results
+
+
+def main(argv=None) -> int:
+    import warnings
+    warnings.simplefilter("ignore")
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--base-latency", type=float, default=0.1, help="seconds per stubbed call before any output")
+    parser.add_argument("--per-char", type=float, default=0.0005, help="seconds per character of stubbed reply")
+    parser.add_argument("--tail-prob", type=float, default=0.05, help="share of stubbed calls that are slow")
+    parser.add_argument("--tail-factor", type=float, default=5.0, help="how much slower those calls are")
+    parser.add_argument("--hedge-after", type=float, default=None, help="also run the split modes with this hedge")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    opts = {k: getattr(args, k) for k in ("base_latency", "per_char", "tail_prob", "tail_factor", "seed")}
+    results = run(args.modes, args.requests, args.concurrency, args.hedge_after, opts)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": {**opts, "hedge_after": args.hedge_after}, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Cold-start import cost per module, measured in fresh interpreters with -X importtime.
+
+    python bench/bench_startup.py [module ...] [--repeat N] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse, json, os, statistics, subprocess, sys, time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "data.prompt_compactor",
+    "data.data_cleaner",
+    "asin_cache",
+    "result_cache",
+    "http_pool",
+    "gpt_infer",
+    "batch_profile",
+]
+
+
+def _run(statement: str):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            cum_us = int(fields[1])
+        except ValueError:
+            continue  # header row
+        entries.append((fields[2].strip(), cum_us, not fields[2].startswith("  ")))
+    return wall_ms, entries
+
+
+def _import_once(module: str, startup: set) -> Dict:
+    wall_ms, entries = _run(f"import {module}")
+    # top-level entries not already loaded by a bare interpreter (site, .pth
+    # hooks) are what the import statement itself pulled in
+    ours = [(name, cum_us) for name, cum_us, top in entries if top and name not in startup]
+    heaviest = sorted(((cum_us, name) for name, cum_us, _ in entries if name not in startup), reverse=True)
+    return {"wall_ms": wall_ms, "import_ms": sum(us for _, us in ours) / 1000, "heaviest": heaviest[:5]}
+
+
+def bench(modules: List[str], repeat: int = 5) -> Dict[str, Dict]:
+    startup = {name for name, _, _ in _run("pass")[1]}
+    results = {}
+    for module in modules:
+        runs = [_import_once(module, startup) for _ in range(repeat)]
+        results[module] = {
+            "import_ms_median": statistics.median(r["import_ms"] for r in runs),
+            "wall_ms_median": statistics.median(r["wall_ms"] for r in runs),
+            "heaviest_imports_ms": [(name, us / 1000) for us, name in runs[-1]["heaviest"]],
+        }
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    results = bench(args.modules, args.repeat)
+    for module, r in results.items():
+        top = ", ".join(f"{name} {ms:.0f}ms" for name, ms in r["heaviest_imports_ms"][:3])
+        print(f"{module:<24} import {r['import_ms_median']:8.1f} ms   process {r['wall_ms_median']:8.1f} ms   [{top}]")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Local stand-ins for OpenAI, DuckDuckGo and Unsplash with configurable latency."""
+from __future__ import annotations
+
+import asyncio, json, random, time, zlib
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+STUB_PROFILE = {
+    "age": "25-34",
+    "gender": "Female",
+    "profession": "Employed",
+    "lifestyle": ["Active", "Health-conscious"],
+    "personality": ["Organized", "Practical"],
+    "hobbies": ["Cooking", "Fitness", "Reading"],
+    "shopping_style": ["Researcher", "Quality-focused"],
+}
+STUB_RECS = [
+    {"name": "Ember Temperature Control Smart Mug 2", "reason": "Keeps coffee warm", "url": "https://www.amazon.com/s?k=ember+mug"},
+    {"name": "Kindle Paperwhite (16 GB)", "reason": "Reads a lot", "url": "https://www.amazon.com/dp/B08KTZ8249"},
+    {"name": "Lodge Cast Iron Skillet, 12 inch", "reason": "Cooks at home", "url": ""},
+    {"name": "TriggerPoint GRID Foam Roller", "reason": "Recovery after workouts", "url": "https://example.com/roller"},
+    {"name": "Hydro Flask Wide Mouth 32 oz", "reason": "Stays hydrated", "url": ""},
+]
+
+
+def stub_reply(n_recs: int = 5) -> str:
+    return json.dumps({"profile": STUB_PROFILE, "recommendations": STUB_RECS[:n_recs]})
+
+
+class _Latency:
+    def __init__(self, seconds: float, jitter: float = 0.0, seed: int = 0):
+        self.seconds = seconds
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    def delay(self) -> float:
+        return self.seconds + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+
+    def sleep(self) -> None:
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def asleep(self) -> None:
+        delay = self.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class StubChatCompletions:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, reply: Optional[str] = None,
+                 stream_chunk_chars: int = 16):
+        self.latency = _Latency(latency, jitter)
+        self.reply = reply or stub_reply()
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.latency.sleep()
+        if kwargs.get("stream"):
+            return (
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.reply[i:i + self.stream_chunk_chars]))])
+                for i in range(0, len(self.reply), self.stream_chunk_chars)
+            )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+
+class StubAsyncChatCompletions(StubChatCompletions):
+    async def create(self, **kwargs):
+        self.calls += 1
+        await self.latency.asleep()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+
+class StubOpenAI:
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=StubChatCompletions(**kwargs))
+
+
+class StubAsyncOpenAI:
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=StubAsyncChatCompletions(**kwargs))
+
+
+def stub_lookups(dp_latency: float = 0.0, thumb_latency: float = 0.0, jitter: float = 0.0):
+    dp_wait, thumb_wait = _Latency(dp_latency, jitter, 1), _Latency(thumb_latency, jitter, 2)
+
+    def first_amazon_dp(keyword: str) -> Optional[str]:
+        dp_wait.sleep()
+        return _stub_dp(keyword)
+
+    def unsplash_thumb(keyword: str, page: int = 1) -> Optional[str]:
+        thumb_wait.sleep()
+        return _stub_thumb(keyword, page)
+
+    return first_amazon_dp, unsplash_thumb
+
+
+def async_stub_lookups(dp_latency: float = 0.0, thumb_latency: float = 0.0, jitter: float = 0.0):
+    dp_wait, thumb_wait = _Latency(dp_latency, jitter, 1), _Latency(thumb_latency, jitter, 2)
+
+    async def first_amazon_dp(keyword: str) -> Optional[str]:
+        await dp_wait.asleep()
+        return _stub_dp(keyword)
+
+    async def unsplash_thumb(keyword: str, page: int = 1) -> Optional[str]:
+        await thumb_wait.asleep()
+        return _stub_thumb(keyword, page)
+
+    return first_amazon_dp, unsplash_thumb
+
+
+def _stub_dp(keyword: str) -> Optional[str]:
+    return f"https://www.amazon.com/dp/B0{zlib.crc32(keyword.encode()) % 10**8:08d}" if keyword else None
+
+
+def _stub_thumb(keyword: str, page: int) -> Optional[str]:
+    return f"https://images.unsplash.com/stub-{zlib.crc32(keyword.encode()) % 1000}-{page}?w=200" if keyword else None
+
+
+def install(gpt_infer, llm_latency: float = 0.0, dp_latency: float = 0.0, thumb_latency: float = 0.0,
+            jitter: float = 0.0) -> Callable[[], None]:
+    """Point gpt_infer at the stubs; returns a function that restores the originals."""
+    saved = {name: getattr(gpt_infer, name) for name in ("client", "_first_amazon_dp", "_unsplash_thumb")}
+    gpt_infer.client = StubOpenAI(latency=llm_latency, jitter=jitter)
+    gpt_infer._first_amazon_dp, gpt_infer._unsplash_thumb = stub_lookups(dp_latency, thumb_latency, jitter)
+
+    def restore() -> None:
+        for name, value in saved.items():
+            setattr(gpt_infer, name, value)
+    return restore
+
+
+def install_async(gpt_infer_async, llm_latency: float = 0.0, dp_latency: float = 0.0, thumb_latency: float = 0.0,
+                  jitter: float = 0.0) -> Callable[[], None]:
+    """install() for gpt_infer_async."""
+    saved = {name: getattr(gpt_infer_async, name) for name in ("aclient", "_afirst_amazon_dp", "_aunsplash_thumb")}
+    gpt_infer_async.aclient = StubAsyncOpenAI(latency=llm_latency, jitter=jitter)
+    gpt_infer_async._afirst_amazon_dp, gpt_infer_async._aunsplash_thumb = async_stub_lookups(dp_latency, thumb_latency, jitter)
+
+    def restore() -> None:
+        for name, value in saved.items():
+            setattr(gpt_infer_async, name, value)
+    return restore
@@ -1,60 +1,253 @@
+import io
+import numpy as np
 import pandas as pd
 import os
-from datetime import timedelta
 import re
+import sqlite3
+import tempfile
 
-def clean_order_csv(file_path):
-    df = pd.read_csv(file_path)
+try:
+    from metrics import span
+except ImportError:  # run as a script, without the repo root on sys.path
+    from contextlib import nullcontext
+
+    def span(stage, **labels):
+        return nullcontext()
+
+FIELDS = ['Order Date', 'Product Name', 'Shipping Address', 'Unit Price']
+FIELD_DTYPES = {
+    'Order Date': str,
+    'Product Name': str,
+    'Shipping Address': 'category',
+    'Unit Price': str,
+}
+ORDER_ID = 'Order ID'
+DEDUP_WINDOW_DAYS = 30
+STREAM_CHUNKSIZE = 50_000
+
+
+def _address_window_mask(addresses, days, window=DEDUP_WINDOW_DAYS, last_seen=None):
+    # addresses/days must already be in date order; keeps the first order per
+    # address, then the next one strictly more than `window` days after it.
+    # `last_seen` (address -> last kept day) carries the window across calls
+    # and is updated in place.
+    n = len(days)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+
+    codes, uniques = pd.factorize(addresses)
+    order = np.argsort(codes, kind="stable")
+    grouped_days = days[order]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [n]))
+
+    for start, end in zip(starts, ends):
+        group = grouped_days[start:end]
+        address = uniques[codes[order[start]]]
+        i = 0
+        if last_seen is not None and address in last_seen:
+            i = np.searchsorted(group, last_seen[address] + window, side="right")
+        last_kept = None
+        while i < len(group):
+            keep[order[start + i]] = True
+            last_kept = group[i]
+            i = np.searchsorted(group, last_kept + window, side="right")
+        if last_seen is not None and last_kept is not None:
+            last_seen[address] = last_kept
+    return keep
+
+
+_NAME_RE = re.compile(r"^(.*?)\d{3,5}")
+_COUNTRY_RE = re.compile(r"(?i)united states")
+_ROOM_RE = re.compile(r"(?i)[a-z ]*house rm \d+[a-z]?")
+
+
+def _split_address(addr):
+    # -> (recipient name before the street number, address without it)
+    name_match = _NAME_RE.match(addr)
+    name = name_match.group(1).strip() if name_match else ""
+    stripped_addr = addr[name_match.end():] if name_match else addr
+    stripped_addr = _ROOM_RE.sub("", _COUNTRY_RE.sub("", stripped_addr))
+    return name, " ".join(stripped_addr.strip().split())
 
-    fields = ['Order Date', 'Product Name', 'Shipping Address', 'Unit Price']
-    for f in fields:
+
+def _simplify_addresses(addresses, seen_names):
+    # Each distinct address is parsed once. The first row naming a recipient
+    # not in `seen_names` keeps the name in front; every other row gets the
+    # bare address. seen_names is filled in place so callers can persist it.
+    codes, uniques = pd.factorize(addresses)
+    if not len(uniques):
+        return np.array([], dtype=object)
+    parsed = [_split_address(str(addr)) for addr in uniques]
+    out = np.array([cleaned for _, cleaned in parsed], dtype=object)[codes]
+    # factorize numbers addresses by first appearance, so the k-th first
+    # occurrence is the first row of address k
+    first_rows = np.flatnonzero(~pd.Series(codes).duplicated().to_numpy())
+    for code, (name, cleaned) in enumerate(parsed):
+        if name and name not in seen_names:
+            seen_names.add(name)
+            out[first_rows[code]] = f"{name} {cleaned}".strip()
+    return out
+
+
+def _format_unique(values, fmt):
+    # fmt applied once per distinct value
+    codes, uniques = pd.factorize(values)
+    return np.array([fmt(v) for v in uniques], dtype=object)[codes]
+
+
+def _read_orders(file_path, chunksize=None, columns=FIELDS):
+    return pd.read_csv(
+        file_path,
+        usecols=lambda c: c in columns,
+        dtype={**FIELD_DTYPES, ORDER_ID: str},
+        chunksize=chunksize,
+    )
+
+
+def _prepare_orders(df, seen_names):
+    for f in FIELDS:
         if f not in df.columns:
             raise ValueError(f"Missing required column: {f}")
 
-    df = df[fields].dropna(subset=['Order Date', 'Product Name'])
+    df = df[FIELDS].dropna(subset=['Order Date', 'Product Name'])
 
     df['Order Date'] = pd.to_datetime(df['Order Date'], errors='coerce')
     df = df.dropna(subset=['Order Date'])
     df['Order Date'] = df['Order Date'].dt.date
 
-    df['Unit Price'] = df['Unit Price'].fillna(0).apply(lambda x: f"${float(x):.2f}")
+    prices = pd.to_numeric(df['Unit Price'], errors='coerce').fillna(0)
+    df['Unit Price'] = _format_unique(prices.to_numpy(), lambda x: f"${float(x):.2f}")
+
+    with span("address_simplify"):
+        addresses = df['Shipping Address'].astype(object).fillna("unknown address").to_numpy()
+        df['Shipping Address'] = _simplify_addresses(addresses, seen_names)
+
+    # stable, so same-day rows keep their file order however the file is chunked
+    df = df.sort_values(by='Order Date', kind='stable')
+    return df
+
+
+def _order_days(df):
+    return pd.to_datetime(df['Order Date']).values.astype('datetime64[D]').astype(np.int64)
+
+
+def _dedup_window(df, last_seen=None):
+    with span("dedup_window"):
+        return df[_address_window_mask(df['Shipping Address'].values, _order_days(df), last_seen=last_seen)]
+
+
+def _format_lines(df):
+    if df.empty:
+        return []
+    with span("prompt_build"):
+        dates = _format_unique(df['Order Date'].to_numpy(), str)
+        names = df['Product Name'].to_numpy(dtype=object)
+        lines = (dates + ": " + names + " - " + df['Unit Price'].to_numpy(dtype=object)
+                 + " - shipped to " + df['Shipping Address'].to_numpy(dtype=object))
+        return lines.tolist()
 
-    seen_names = set()
-    def simplify_address(addr):
-        addr = str(addr)
-        name_match = re.match(r"^(.*?)\d{3,5}", addr)
-        name = name_match.group(1).strip() if name_match else ""
-        stripped_addr = re.sub(r"^.*?\d{3,5}", "", addr)
-        stripped_addr = re.sub(r"(?i)united states", "", stripped_addr)
-        stripped_addr = re.sub(r"(?i)[a-z ]*house rm \d+[a-z]?", "", stripped_addr)
-        cleaned = " ".join(stripped_addr.strip().split())
-        if name and name not in seen_names:
-            seen_names.add(name)
-            return f"{name} {cleaned}".strip()
-        return cleaned
 
-    df['Shipping Address'] = df['Shipping Address'].fillna("unknown address").apply(simplify_address)
+def clean_order_csv(file_path):
+    with span("csv_read"):
+        df = _read_orders(file_path)
+    df = _dedup_window(_prepare_orders(df, set()))
+    return '\n'.join(_format_lines(df))
+
+
+def _in_date_order(file_path, chunksize):
+    last = None
+    for chunk in _read_orders(file_path, chunksize=chunksize, columns=['Order Date']):
+        if 'Order Date' not in chunk.columns:
+            return True
+        dates = pd.to_datetime(chunk['Order Date'], errors='coerce').dropna().dt.date
+        if dates.empty:
+            continue
+        if not dates.is_monotonic_increasing or (last is not None and dates.iloc[0] < last):
+            return False
+        last = dates.iloc[-1]
+    return True
+
+
+def _spill_sorted(frames, chunksize):
+    # prepared rows sorted on disk by (day, file position), read back chunk by chunk
+    with tempfile.TemporaryDirectory() as tmp:
+        db = sqlite3.connect(os.path.join(tmp, "orders.sqlite"))
+        try:
+            db.execute("CREATE TABLE orders (day INTEGER, pos INTEGER, date TEXT, product TEXT, address TEXT, price TEXT)")
+            for df in frames:
+                db.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?)", zip(
+                    _order_days(df).tolist(), df.index.tolist(), df['Order Date'].astype(str),
+                    df['Product Name'], df['Shipping Address'], df['Unit Price'],
+                ))
+            cursor = db.execute("SELECT date, product, address, price FROM orders ORDER BY day, pos")
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=FIELDS)
+        finally:
+            db.close()
 
-    df = df.sort_values(by='Order Date')
-    filtered_rows = []
+
+def iter_order_lines(file_path, chunksize=STREAM_CHUNKSIZE):
+    # Streaming variant of clean_order_csv: reads FIELDS only, chunk by chunk,
+    # and yields the same lines. The dedup window carries over between chunks,
+    # which needs the rows in date order; a file that isn't gets its prepared
+    # rows sorted through a temporary SQLite table first.
+    if hasattr(file_path, "read"):
+        # read twice below, and pandas closes a handle it didn't finish
+        data = file_path.read()
+        source = lambda: io.BytesIO(data) if isinstance(data, bytes) else io.StringIO(data)
+    else:
+        source = lambda: file_path
+    in_order = _in_date_order(source(), chunksize)
+
+    seen_names = set()
     last_seen = {}
 
-    for _, row in df.iterrows():
-        address = row['Shipping Address']
-        date = row['Order Date']
-        last_date = last_seen.get(address)
-        if last_date is None or (date - last_date) > timedelta(days=30):
-            filtered_rows.append(row)
-            last_seen[address] = date
+    def prepared():
+        reader = _read_orders(source(), chunksize=chunksize)
+        while True:
+            with span("csv_read"):
+                chunk = next(reader, None)
+            if chunk is None:
+                return
+            yield _prepare_orders(chunk, seen_names)
+
+    frames = prepared() if in_order else _spill_sorted(prepared(), chunksize)
+    for df in frames:
+        yield from _format_lines(_dedup_window(df, last_seen))
+
 
-    df = pd.DataFrame(filtered_rows)
+def clean_new_orders(file_path, state=None):
+    """Incremental clean_order_csv: only rows whose Order ID isn't in ``state``.
 
-    lines = df.apply(
-        lambda row: f"{row['Order Date']}: {row['Product Name']} - {row['Unit Price']} - shipped to {row['Shipping Address']}",
-        axis=1
-    ).tolist()
+    ``state`` is what the previous call returned (or None the first time):
+    seen order ids, the dedup window's last kept day per address and the
+    names already printed by the address simplifier. Returns the order
+    lines for the new rows and the updated state, which is JSON-safe.
+    """
+    state = state or {}
+    seen_ids = set(state.get("order_ids", ()))
+    with span("csv_read"):
+        df = _read_orders(file_path, columns=FIELDS + [ORDER_ID])
+    if ORDER_ID not in df.columns:
+        raise ValueError(f"Missing required column: {ORDER_ID}")
+    order_ids = df[ORDER_ID]
+    fresh = ~order_ids.isin(seen_ids)
 
-    return '\n'.join(lines)
+    seen_names = set(state.get("seen_names", ()))
+    last_seen = {address: int(day) for address, day in state.get("last_seen", {}).items()}
+    df = _dedup_window(_prepare_orders(df[fresh], seen_names), last_seen)
+    new_state = {
+        "order_ids": sorted(seen_ids | set(order_ids[fresh].dropna())),
+        "last_seen": {address: int(day) for address, day in last_seen.items()},
+        "seen_names": sorted(seen_names),
+    }
+    return '\n'.join(_format_lines(df)), new_state
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+from collections import Counter, OrderedDict
+import re
+
+CHARS_PER_TOKEN = 4
+MAX_LISTED_BUCKETS = 4
+MAX_LISTED_ADDRESSES = 2
+
+ORDER_LINE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}): (.*) - \$(-?[\d.]+) - shipped to (.*)$")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _bucket(date, bucket):
+    year, month = date[:4], int(date[5:7])
+    if bucket == "year":
+        return year
+    if bucket == "month":
+        return date[:7]
+    return f"{year}-Q{(month - 1) // 3 + 1}"
+
+
+def _category(product):
+    # head noun of the title ("... Stand Mixer" -> "mixer"), good enough to
+    # keep a spread of item kinds when sampling
+    words = re.findall(r"[a-z]+", product.lower())
+    return words[-1] if words else ""
+
+
+def _price_text(prices):
+    lo, hi = min(prices), max(prices)
+    return f"${lo:.2f}" if lo == hi else f"${lo:.2f}-${hi:.2f}"
+
+
+def _format_item(item, home_address):
+    line = item["product"]
+    if item["count"] > 1:
+        line += f" x{item['count']}"
+    buckets = item["buckets"]
+    if len(buckets) > MAX_LISTED_BUCKETS:
+        when = f"{min(buckets)}..{max(buckets)} ({len(buckets)} periods)"
+    else:
+        when = ", ".join(buckets)
+    line += f" - {_price_text(item['prices'])} - {when}"
+    others = [a for a in item["addresses"] if a != home_address]
+    if others:
+        line += " @ " + "; ".join(others[:MAX_LISTED_ADDRESSES])
+        if len(others) > MAX_LISTED_ADDRESSES:
+            line += f" +{len(others) - MAX_LISTED_ADDRESSES} more addresses"
+    return line
+
+
+def _spread_sample(items, keep):
+    by_category = OrderedDict()
+    for item in sorted(items, key=lambda it: -it["count"]):
+        by_category.setdefault(_category(item["product"]), []).append(item)
+    groups = sorted(by_category.values(), key=lambda g: -sum(it["count"] for it in g))
+    picked = []
+    depth = 0
+    while len(picked) < keep:
+        round_items = [g[depth] for g in groups if depth < len(g)]
+        if not round_items:
+            break
+        picked.extend(round_items[:keep - len(picked)])
+        depth += 1
+    chosen = {id(it) for it in picked}
+    return [it for it in items if id(it) in chosen]
+
+
+def compact_prompt(text, max_chars=None, max_tokens=None, bucket="quarter"):
+    """Shrink clean_order_csv output; returns (compacted_text, stats)."""
+    if max_tokens is not None:
+        token_chars = max_tokens * CHARS_PER_TOKEN
+        max_chars = token_chars if max_chars is None else min(max_chars, token_chars)
+
+    lines = [l for l in text.splitlines() if l.strip()]
+    if max_chars is not None and len(text) <= max_chars:
+        # already within budget: sent as is, per-day dates included
+        return text, _stats(text, lines, text, 0)
+
+    items = OrderedDict()
+    unparsed = []
+    addresses = Counter()
+    dates = []
+    for line in lines:
+        m = ORDER_LINE_RE.match(line)
+        if not m:
+            unparsed.append(line)
+            continue
+        date, product, price, address = m.groups()
+        dates.append(date)
+        addresses[address] += 1
+        item = items.setdefault(product, {"product": product, "count": 0, "prices": [], "buckets": [], "addresses": []})
+        item["count"] += 1
+        item["prices"].append(float(price))
+        b = _bucket(date, bucket)
+        if b not in item["buckets"]:
+            item["buckets"].append(b)
+        if address not in item["addresses"]:
+            item["addresses"].append(address)
+
+    home_address = addresses.most_common(1)[0][0] if addresses else ""
+    items = list(items.values())
+
+    def render(selected):
+        header = []
+        if dates:
+            header.append(
+                f"Orders {_bucket(min(dates), bucket)} to {_bucket(max(dates), bucket)} "
+                f"({len(dates)} orders, {len(items)} distinct items), shipped to {home_address} unless noted."
+            )
+        body = [_format_item(it, home_address) for it in selected] + unparsed
+        chosen = {id(it) for it in selected}
+        dropped = [it for it in items if id(it) not in chosen]
+        if dropped:
+            kinds = len({_category(it["product"]) for it in dropped})
+            body.append(f"... plus {len(dropped)} more items ({sum(it['count'] for it in dropped)} orders) across {kinds} kinds.")
+        return "\n".join(header + body)
+
+    selected = items
+    compacted = render(selected)
+    if max_chars is not None and len(compacted) > max_chars:
+        lo, hi = 0, len(items)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if len(render(_spread_sample(items, mid))) <= max_chars:
+                lo = mid
+            else:
+                hi = mid - 1
+        selected = _spread_sample(items, lo)
+        compacted = render(selected)
+        if len(compacted) > max_chars:
+            compacted = _truncate(compacted, max_chars)
+
+    return compacted, _stats(text, lines, compacted, len(items) - len(selected))
+
+
+def _truncate(text, max_chars):
+    # last whole line that fits, or whole words if even the first line doesn't
+    cut = text.rfind("\n", 0, max_chars + 1)
+    if cut > 0:
+        return text[:cut]
+    return text[:max_chars + 1].rsplit(" ", 1)[0][:max_chars]
+
+
+def _stats(text, lines, compacted, dropped_items):
+    return {
+        "original_lines": len(lines),
+        "compacted_lines": len(compacted.splitlines()),
+        "original_chars": len(text),
+        "compacted_chars": len(compacted),
+        "original_tokens": estimate_tokens(text),
+        "compacted_tokens": estimate_tokens(compacted),
+        "dropped_items": dropped_items,
+        "ratio": len(compacted) / len(text) if text else 1.0,
+    }
@@ -0,0 +1,164 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'Website', 'Order ID', 'Order Date', 'Purchase Order Number', 'Currency', 'Unit Price',
+    'Unit Price Tax', 'Shipping Charge', 'Total Discounts', 'Total Owed', 'Shipment Item Subtotal',
+    'Shipment Item Subtotal Tax', 'ASIN', 'Product Condition', 'Quantity', 'Payment Instrument Type',
+    'Order Status', 'Shipment Status', 'Ship Date', 'Shipping Option', 'Shipping Address',
+    'Billing Address', 'Carrier Name & Tracking Number', 'Product Name', 'Gift Message',
+    'Gift Sender Name', 'Gift Recipient Contact Details', 'Item Serial Number',
+]
+
+PRODUCTS = [
+    ("KitchenAid Artisan Stand Mixer", 449.99), ("Instant Pot Duo 7-in-1 6Qt", 89.99),
+    ("YETI Rambler 20oz", 35.00), ("Stanley Trigger-Action Travel Mug", 25.00),
+    ("Hydro Flask 32 oz", 44.95), ("Nalgene 1L Water Bottle", 14.95),
+    ("Kindle Paperwhite 16GB", 149.99), ("The Great Alone: A Novel", 11.99),
+    ("Atomic Habits, by James Clear", 13.79), ("Catan Board Game", 43.99),
+    ("Nintendo Switch OLED", 349.99), ("Sony WH-CH520 Wireless Headphones", 59.99),
+    ("Blue Yeti USB Microphone", 129.99), ("Samsung T7 1TB SSD", 89.99),
+    ("Anker USB-C Charger 30W", 19.99), ("Echo Dot 5th Gen Charcoal", 49.99),
+    ("Google Nest Thermostat", 129.99), ("Philips Hue White 2-Bulb Pack", 29.99),
+    ("Apple AirTag 4-Pack", 99.99), ("Fitbit Inspire 3", 99.95),
+    ("TriggerPoint GRID Foam Roller", 36.99), ("Gaiam Yoga Mat, 6mm", 29.98),
+    ("Bowflex SelectTech 552 Dumbbells", 429.00), ("Optimum Nutrition Whey Protein, 5 lb", 79.99),
+    ("Patagonia Better Sweater Jacket", 139.00), ("Crocs Classic Clog", 49.99),
+    ("Olaplex No.3 Hair Perfector", 30.00), ("Oral-B Pro 1000 Toothbrush", 49.99),
+    ("Fiskars Pruning Shears", 14.97), ("Miracle-Gro Potting Mix, 2 cu. ft.", 12.98),
+    ("Crayola Watercolor Set", 8.99), ("Winsor & Newton Acrylic Paint Set", 24.99),
+    ("Coleman Sundome Tent, 4 Person", 89.99), ("Osprey Daylite Backpack", 65.00),
+    ("Logitech MX Master 3S Mouse", 99.99), ("Raspberry Pi 4 Model B 4GB", 55.00),
+    ("Moleskine Classic Notebook", 19.95), ("Pilot G2 Gel Pens, 12 Pack", 13.49),
+    ("Amazon Basics AA Batteries, 48 Pack", 15.99), ("Bounty Paper Towels, 12 Rolls", 31.99),
+]
+
+CITIES = [
+    ("Springfield", "IL", "62704"), ("Boston", "MA", "02134"), ("Cambridge", "MA", "02138"),
+    ("Seattle", "WA", "98101"), ("Austin", "TX", "73301"), ("Denver", "CO", "80202"),
+    ("Portland", "OR", "97205"), ("Madison", "WI", "53703"), ("Raleigh", "NC", "27601"),
+]
+STREETS = ["Maple St", "Oak Ave", "Pine Rd", "Elm St", "Main St", "Cedar Ln", "Lakeview Dr", "2nd Ave"]
+FIRST_NAMES = ["Jane", "John", "Alex", "Sam", "Priya", "Wei", "Maria", "Omar", "Lena", "Chris"]
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Chen", "Patel", "Kim", "Nguyen", "Brown", "Lopez", "Khan"]
+
+
+def _addresses(rng, count):
+    out = []
+    for i in range(count):
+        city, state, zipcode = CITIES[rng.integers(len(CITIES))]
+        number = int(rng.integers(100, 99999))
+        base = f"{number} {STREETS[rng.integers(len(STREETS))]}  {city}  {state} {zipcode}"
+        out.append(base)
+    return out
+
+
+def _messy(rng, address):
+    # the kinds of noise _simplify_addresses has to cope with in real exports
+    kind = rng.integers(5)
+    if kind == 0:
+        name = f"{FIRST_NAMES[rng.integers(len(FIRST_NAMES))]} {LAST_NAMES[rng.integers(len(LAST_NAMES))]}"
+        return f"{name} {address}"
+    if kind == 1:
+        return f"{address} United States"
+    if kind == 2:
+        return f"{LAST_NAMES[rng.integers(len(LAST_NAMES))]} House Rm {rng.integers(1, 400)}{'AB'[rng.integers(2)]} {address}"
+    if kind == 3:
+        return "  ".join(address.upper().split())
+    return f"{address} UNITED STATES"
+
+
+def _chunk(rng, rows, addresses, messy_rate, missing_price_rate, start_ts, span_s):
+    product_idx = rng.integers(len(PRODUCTS), size=rows)
+    names = np.array([p[0] for p in PRODUCTS], dtype=object)[product_idx]
+    base_prices = np.array([p[1] for p in PRODUCTS])[product_idx]
+    prices = np.round(base_prices * rng.uniform(0.8, 1.1, size=rows), 2)
+    tax = np.round(prices * 0.07, 2)
+    quantity = rng.choice([1, 1, 1, 1, 2, 3], size=rows)
+
+    # a heavy-tailed spread of orders over addresses, like real households
+    addr_idx = np.minimum(rng.zipf(1.3, size=rows) - 1, len(addresses) - 1)
+    addr = np.array(addresses, dtype=object)[addr_idx]
+    messy = rng.random(rows) < messy_rate
+    addr[messy] = [_messy(rng, a) for a in addr[messy]]
+
+    order_ts = start_ts + pd.to_timedelta(rng.integers(0, span_s, size=rows), unit="s")
+    ship_ts = order_ts + pd.to_timedelta(rng.integers(1, 6, size=rows), unit="D")
+
+    order_ids = [f"{a:03d}-{b:07d}-{c:07d}" for a, b, c in zip(
+        rng.integers(100, 1000, size=rows), rng.integers(0, 10**7, size=rows), rng.integers(0, 10**7, size=rows))]
+    asins = ["B0" + "".join(chr(65 + int(x) % 26) if x >= 10 else str(x) for x in digits)
+             for digits in rng.integers(0, 36, size=(rows, 8))]
+
+    df = pd.DataFrame({
+        'Website': "Amazon.com",
+        'Order ID': order_ids,
+        'Order Date': order_ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'Purchase Order Number': "Not Applicable",
+        'Currency': "USD",
+        'Unit Price': prices,
+        'Unit Price Tax': tax,
+        'Shipping Charge': 0.0,
+        'Total Discounts': 0,
+        'Total Owed': np.round((prices + tax) * quantity, 2),
+        'Shipment Item Subtotal': np.round(prices * quantity, 2),
+        'Shipment Item Subtotal Tax': np.round(tax * quantity, 2),
+        'ASIN': asins,
+        'Product Condition': "New",
+        'Quantity': quantity,
+        'Payment Instrument Type': rng.choice(["Visa", "MasterCard", "American Express", "Gift Certificate/Card"], size=rows),
+        'Order Status': "Shipped",
+        'Shipment Status': "Delivered",
+        'Ship Date': ship_ts.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+        'Shipping Option': rng.choice(["standard", "expedited", "next-1dc", "second-nominated-day"], size=rows),
+        'Shipping Address': addr,
+        'Billing Address': addr,
+        'Carrier Name & Tracking Number': [f"UPS 1Z{n:016X}" for n in rng.integers(0, 2**62, size=rows)],
+        'Product Name': names,
+        'Gift Message': "Not Available",
+        'Gift Sender Name': "Not Available",
+        'Gift Recipient Contact Details': "Not Available",
+        'Item Serial Number': "Not Available",
+    }, columns=COLUMNS)
+
+    df.loc[rng.random(rows) < missing_price_rate, 'Unit Price'] = np.nan
+    df.loc[rng.random(rows) < 0.002, 'Order Date'] = "Not Available"
+    df.loc[rng.random(rows) < 0.002, 'Product Name'] = np.nan
+    return df
+
+
+def generate_orders_csv(path, rows, seed=0, addresses=None, messy_rate=0.15, missing_price_rate=0.05,
+                        start="2015-01-01", end="2025-06-01", chunk_rows=200_000):
+    rng = np.random.default_rng(seed)
+    if addresses is None:
+        addresses = max(1, min(rows // 50, 50_000))
+    address_pool = _addresses(rng, addresses)
+    start_ts = pd.Timestamp(start)
+    span_s = int((pd.Timestamp(end) - start_ts).total_seconds())
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            df = _chunk(rng, n, address_pool, messy_rate, missing_price_rate, start_ts, span_s)
+            df.to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic Amazon order-history export.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--addresses", type=int, default=None)
+    parser.add_argument("--messy-rate", type=float, default=0.15)
+    parser.add_argument("--missing-price-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    generate_orders_csv(args.path, args.rows, args.seed, args.addresses, args.messy_rate, args.missing_price_rate)
+    print(f"wrote {args.rows} rows to {args.path}")
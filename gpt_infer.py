@@ -1,20 +1,119 @@
 from __future__ import annotations
 
-import json, os, re, urllib.parse
-from typing import List, Dict, Optional
+import json, os, re, sqlite3, threading, time, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional, Sequence, Tuple
+
+from asin_cache import AsinCache
+from metrics import registry, span
+from replay import ReplayTransport
+from result_cache import DiskBackend, MemoryBackend, ResultCache, content_key
+from scheduler import LookupScheduler
+
+# openai, requests and .env are loaded on first use, to keep the import cheap
+client = None
+_asin_cache: Optional[AsinCache] = None
+_result_cache: Optional[ResultCache] = None
+_transport: Optional[ReplayTransport] = None
+_scheduler: Optional[LookupScheduler] = None
+_env_loaded = False
+_init_lock = threading.Lock()
+
+
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    global _env_loaded
+    if not _env_loaded:
+        with _init_lock:
+            if not _env_loaded:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _env_loaded = True
+    return os.getenv(name, default)
+
+
+def _client():
+    global client
+    if client is None:
+        api_key = _env("OPENAI_API_KEY")
+        with _init_lock:
+            if client is None:
+                import openai
+                client = openai.OpenAI(api_key=api_key)
+    return client
+
+
+def _get_asin_cache() -> AsinCache:
+    global _asin_cache
+    if _asin_cache is None:
+        path = _env("ASIN_CACHE_PATH", os.path.join(".cache", "asin_cache.sqlite3"))
+        with _init_lock:
+            if _asin_cache is None:
+                _asin_cache = AsinCache(path)
+    return _asin_cache
+
+
+def _cached_dp(keyword: str) -> Tuple[bool, Optional[str]]:
+    # a locked or corrupt cache costs a live lookup, not the profile
+    try:
+        cached, dp_url = _get_asin_cache().get(keyword)
+    except (sqlite3.Error, OSError):
+        registry.inc("asin_cache_errors_total", op="get")
+        return False, None
+    registry.inc("asin_cache_total", result="hit" if cached else "miss")
+    return cached, dp_url
+
+
+def _store_dp(keyword: str, dp_url: Optional[str]) -> None:
+    try:
+        _get_asin_cache().put(keyword, dp_url)
+    except (sqlite3.Error, OSError):
+        registry.inc("asin_cache_errors_total", op="put")
+
+
+def _get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        cache_dir = _env("PROFILE_CACHE_DIR")
+        with _init_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(DiskBackend(cache_dir) if cache_dir else MemoryBackend())
+    return _result_cache
+
+
+def _get_transport() -> ReplayTransport:
+    global _transport
+    if _transport is None:
+        _env("REPLAY_MODE")
+        with _init_lock:
+            if _transport is None:
+                _transport = ReplayTransport.from_env()
+    return _transport
+
+
+def _get_scheduler() -> LookupScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _env("LOOKUP_RATE_LIMITS")
+        with _init_lock:
+            if _scheduler is None:
+                _scheduler = LookupScheduler.from_env()
+    return _scheduler
+
 
-import openai
-import requests
-from dotenv import load_dotenv
+def _chat(**kwargs):
+    return _get_transport().chat(lambda **kw: _client().chat.completions.create(**kw), **kwargs)
 
-load_dotenv()
-OPENAI_KEY   = os.getenv("OPENAI_API_KEY")
-UNSPLASH_KEY = os.getenv("UNSPLASH_KEY")    
 
-client = openai.OpenAI(api_key=OPENAI_KEY)
+def _http_get(url: str, **kwargs):
+    from http_pool import http
+    params = kwargs.get("params")
+    return _get_scheduler().get(url, params, lambda: _get_transport().get(lambda: http.get(url, **kwargs), url, params))
+
 
 UA = {"User-Agent": "Mozilla/5.0", "Accept-Version": "v1"}
 _PLACEHOLDER = "https://via.placeholder.com/120?text=No+Image+Available"
+ENRICH_WORKERS = 8
+MODEL = "o4-mini-2025-04-16"
 
 AGE_RANGES = ["Under 18", "18-24", "25-34", "35-44", "45-54", "55-64", "65+", "Unknown"]
 GENDER_OPTIONS = ["Male", "Female", "Non-binary", "Other", "Unknown"]
@@ -24,50 +123,99 @@ PERSONALITY_OPTIONS = ["Outgoing", "Introverted", "Practical", "Creative", "Anal
 HOBBY_OPTIONS = ["Reading", "Gaming", "Cooking", "Sports", "Traveling", "Music", "Movies/TV", "Art/Crafts", "Gardening", "Tech/Coding", "Fitness", "Writing"]
 SHOPPING_STYLE_OPTIONS = ["Budget-conscious", "Brand-loyal", "Impulse buyer", "Researcher", "Comfort-seeker", "Trend-follower", "Quality-focused", "Eco-conscious"]
 
-SYSTEM_PROMPT = f"""
-Generate a JSON output with 'profile' and 'recommendations' keys from Amazon order summaries.
-'profile': Compact dict. For traits below, STRICTLY select from the given options.
-- 'age' (ONE from): {AGE_RANGES}
-- 'gender' (ONE from): {GENDER_OPTIONS}
-- 'profession' (ONE from): {PROFESSION_OPTIONS}
-- 'lifestyle' (LIST of one or more from): {LIFESTYLE_OPTIONS}
-- 'personality' (LIST of one or more from): {PERSONALITY_OPTIONS}
-- 'hobbies' (LIST of one or more from): {HOBBY_OPTIONS}
-- 'shopping_style' (LIST of one or more from): {SHOPPING_STYLE_OPTIONS}
+_TRAIT_SPECS = {
+    "age": f"- 'age' (ONE from): {AGE_RANGES}",
+    "gender": f"- 'gender' (ONE from): {GENDER_OPTIONS}",
+    "profession": f"- 'profession' (ONE from): {PROFESSION_OPTIONS}",
+    "lifestyle": f"- 'lifestyle' (LIST of one or more from): {LIFESTYLE_OPTIONS}",
+    "personality": f"- 'personality' (LIST of one or more from): {PERSONALITY_OPTIONS}",
+    "hobbies": f"- 'hobbies' (LIST of one or more from): {HOBBY_OPTIONS}",
+    "shopping_style": f"- 'shopping_style' (LIST of one or more from): {SHOPPING_STYLE_OPTIONS}",
+}
+
+
+def _profile_spec(traits: Sequence[str] = tuple(_TRAIT_SPECS)) -> str:
+    lines = "\n".join(_TRAIT_SPECS[t] for t in _TRAIT_SPECS if t in traits)
+    return f"""'profile': Compact dict. For traits below, STRICTLY select from the given options.
+{lines}
 If undetermined, use "Unknown" for single-choice; omit multi-choice if none apply.
+"""
+
 
-'recommendations': List of 3-5 suggested items (each a dict with 'name', 'reason', 'url').
+_PROFILE_SPEC = _profile_spec()
+_RECS_SPEC = """'recommendations': List of 3-5 suggested items (each a dict with 'name', 'reason', 'url').
 - 'name': Provide an ACCURATE, concise, and SPECIFIC product title that clearly describes the item. For example, instead of just 'USB Hub', use 'Anker USB C Hub, 5-in-1 Adapter'. This title will be used for generating fallback search URLs AND for finding a relevant image. A descriptive name like 'Brand Model Type of Product' is key for good image matching.
 - 'url': CRITICAL - Provide a direct, VALID, and WORKING Amazon.com product page URL (must contain '/dp/ASIN', e.g., https://www.amazon.com/dp/B01F8XCDHI). Verify the ASIN leads to an active product page.
     - If, and ONLY IF, a direct product page URL cannot be confidently provided, THEN generate a specific Amazon.com search URL (e.g., https://www.amazon.com/s?k=exact+product+name) that is highly likely to show the intended product as a top result.
     - DO NOT provide URLs to non-Amazon sites. DO NOT invent ASINs or use placeholder ASINs. All URLs must be for amazon.com.
+"""
+_PROFILE_EXAMPLE = """Profile example: { "age": "25-34", "gender": "Female", "profession": "Employed", "lifestyle": ["Active"], "hobbies": ["Gaming", "Reading"], "shopping_style": ["Researcher"] }
+"""
+
+SYSTEM_PROMPT = f"""
+Generate a JSON output with 'profile' and 'recommendations' keys from Amazon order summaries.
+{_PROFILE_SPEC}
+{_RECS_SPEC}
+Response MUST be compact JSON. Do not repeat input summaries.
+{_PROFILE_EXAMPLE}"""
+
+# its own, shorter prompt: the delta call exists to send fewer tokens than a full one
+DELTA_SYSTEM_PROMPT = f"""
+UPDATE a shopper's JSON 'profile' and 'recommendations'. The user message holds 'previous_profile' (built from older orders) and 'new_orders' placed since.
+{_PROFILE_SPEC}
+Return the full updated 'profile': keep previous traits the new orders don't contradict, add or change traits they clearly support.
+'recommendations': 3-5 fresh items suited to the updated profile, favouring what the new orders suggest; each a dict with 'name' (a specific 'Brand Model Type' title), 'reason' and 'url' (an amazon.com /dp/ASIN page, else an amazon.com/s?k= search URL; never invent ASINs).
+Response MUST be compact JSON. Do not repeat input summaries.
+"""
 
+def _fill_system_prompt(traits: Sequence[str]) -> str:
+    # the settled traits' option lists and the full example are left out: a fill is meant to send fewer tokens
+    return f"""
+Generate a JSON output with 'profile' and 'recommendations' keys from Amazon order summaries.
+The user message starts with traits already determined; the 'profile' holds ONLY the traits below.
+{_profile_spec(traits)}
+{_RECS_SPEC}
 Response MUST be compact JSON. Do not repeat input summaries.
-Profile example: {{ "age": "25-34", "gender": "Female", "profession": "Employed", "lifestyle": ["Active"], "hobbies": ["Gaming", "Reading"], "shopping_style": ["Researcher"] }}
 """
 
+
 def _amazon_search(keyword: str) -> str:
     if not keyword: 
         return "https://www.amazon.com/" 
     return "https://www.amazon.com/s?k=" + urllib.parse.quote_plus(keyword)
 
 
+def _dp_from_search_html(text: str) -> Optional[str]:
+    html = urllib.parse.unquote(text)
+    match = re.search(r"https://www\.amazon\.com/(?:[^\"\'\s]+/)?(?:dp|gp/product)/([A-Z0-9]{10})", html, re.IGNORECASE)
+    return f"https://www.amazon.com/dp/{match.group(1)}" if match else None
+
+
+def _ddg_search_url(keyword: str) -> str:
+    q = urllib.parse.quote_plus(f"{keyword} site:amazon.com/dp")
+    return f"https://html.duckduckgo.com/html/?q={q}"
+
+
+def _unsplash_params(keyword: str, page: int) -> Dict:
+    return {"query": keyword, "per_page": 1, "orientation": "squarish", "page": page}
+
+
 def _first_amazon_dp(keyword: str) -> Optional[str]:
     if not keyword:
         return None
+    cached, dp_url = _cached_dp(keyword)
+    if cached:
+        return dp_url
+    import requests
     try:
-        q = urllib.parse.quote_plus(f"{keyword} site:amazon.com/dp")
-        search_url = f"https://html.duckduckgo.com/html/?q={q}"
+        search_url = _ddg_search_url(keyword)
         
-        html = requests.get(search_url, headers=UA, timeout=7).text
-        html = urllib.parse.unquote(html)
-        
-        match = re.search(r"https://www\.amazon\.com/(?:[^\"\'\s]+/)?(?:dp|gp/product)/([A-Z0-9]{10})", html, re.IGNORECASE)
-        
-        if match:
-            asin = match.group(1)
-            return f"https://www.amazon.com/dp/{asin}"
-        return None
+        with span("asin_lookup"):
+            resp = _http_get(search_url, headers=UA, timeout=7)
+        dp_url = _dp_from_search_html(resp.text)
+        if dp_url or resp.status_code == 200:
+            _store_dp(keyword, dp_url)
+        return dp_url
     except requests.exceptions.RequestException:
         return None
     except Exception: 
@@ -84,19 +232,22 @@ def _is_amazon_domain(url: str) -> bool:
 
 
 def _unsplash_thumb(keyword: str, page: int = 1) -> Optional[str]: 
-    if not UNSPLASH_KEY or not keyword:
+    unsplash_key = _env("UNSPLASH_KEY")
+    if not unsplash_key or not keyword:
         return None
+    import requests
     
     search_query = keyword 
 
     try:
-        r = requests.get(
-            "https://api.unsplash.com/search/photos",
-            params={"query": search_query, "per_page": 1, "orientation": "squarish", "page": page},
-            headers={"Authorization": f"Client-ID {UNSPLASH_KEY}", **UA},
-            timeout=4,
-        )
-        r.raise_for_status() 
+        with span("thumbnail_lookup", page=page):
+            r = _http_get(
+                "https://api.unsplash.com/search/photos",
+                params=_unsplash_params(search_query, page),
+                headers={"Authorization": f"Client-ID {unsplash_key}", **UA},
+                timeout=4,
+            )
+            r.raise_for_status() 
         hits = r.json().get("results", [])
         return hits[0]["urls"]["thumb"] if hits else None
     except requests.exceptions.RequestException: 
@@ -107,102 +258,236 @@ def _unsplash_thumb(keyword: str, page: int = 1) -> Optional[str]:
         return None
 
 
-def _fix_recs(recs: List[Dict]) -> List[Dict]:
-    out = []
-    if not isinstance(recs, list):
-        return out
-    
-    used_image_urls = set()
+def _resolve_rec_url(name: str, original_url: str) -> str:
+    if _is_amazon_product_page(original_url):
+        return original_url
 
-    for r_item in recs:
-        if not isinstance(r_item, dict):
-            continue
+    dp_link = _first_amazon_dp(name)
+    if dp_link:
+        return dp_link
+    if _is_amazon_domain(original_url) and original_url:
+        return original_url
+    return _amazon_search(name)
 
-        name = (r_item.get("name") or "").strip()
-        original_url_from_gpt  = (r_item.get("url")  or "").strip()
-        current_url = original_url_from_gpt
 
-        if not name:
-            r_item["url"] = current_url or "https://www.amazon.com"
-            r_item["img"] = _PLACEHOLDER
-            out.append(r_item)
-            continue
+def _rec_items(recs) -> Tuple[List[Dict], List[str], List[int]]:
+    # -> (dict items, their stripped names, indexes of the named ones)
+    items = [r_item for r_item in recs if isinstance(r_item, dict)] if isinstance(recs, list) else []
+    names = [(r_item.get("name") or "").strip() for r_item in items]
+    return items, names, [i for i, name in enumerate(names) if name]
 
-        if not _is_amazon_product_page(current_url):
-            dp_link = _first_amazon_dp(name) 
-            if dp_link:
-                current_url = dp_link
-            elif _is_amazon_domain(original_url_from_gpt) and original_url_from_gpt: 
-                current_url = original_url_from_gpt 
-            else: 
-                current_url = _amazon_search(name)
-        
-        if not current_url:
-            current_url = _amazon_search(name)
-        
-        r_item["url"] = current_url
 
-        img_url = _unsplash_thumb(name, page=1)
-        if img_url and img_url in used_image_urls: 
-            img_url_page2 = _unsplash_thumb(name, page=2) 
-            if img_url_page2 and img_url_page2 not in used_image_urls:
-                img_url = img_url_page2
-            else: 
-                img_url = _PLACEHOLDER 
-        
-        if img_url and img_url != _PLACEHOLDER:
-            used_image_urls.add(img_url)
-            r_item["img"] = img_url
-        else:
-            r_item["img"] = _PLACEHOLDER 
+def _unnamed_rec(r_item: Dict) -> Dict:
+    r_item["url"] = (r_item.get("url") or "").strip() or "https://www.amazon.com"
+    r_item["img"] = _PLACEHOLDER
+    return r_item
+
+
+def _page2_needed(named: List[int], first_thumbs: Dict[int, Optional[str]]) -> List[int]:
+    # a page-1 image already taken by an earlier card always collides, so
+    # those page-2 lookups can be started up front
+    needed, earlier = [], set()
+    for i in named:
+        img_url = first_thumbs[i]
+        if img_url and img_url in earlier:
+            needed.append(i)
+        if img_url:
+            earlier.add(img_url)
+    return needed
+
+
+def _take_image(img_url: Optional[str], used_image_urls: set, page2_url: Optional[str] = None) -> str:
+    # page2_url is only looked at when img_url is already taken
+    if img_url and img_url in used_image_urls:
+        img_url = page2_url if page2_url and page2_url not in used_image_urls else _PLACEHOLDER
+    if img_url and img_url != _PLACEHOLDER:
+        used_image_urls.add(img_url)
+        return img_url
+    return _PLACEHOLDER
+
 
-        out.append(r_item)
+def _pick_image(name: str, img_url: Optional[str], used_image_urls: set, page2=None) -> str:
+    page2_url = None
+    if img_url and img_url in used_image_urls:
+        page2_url = page2.result() if page2 else _unsplash_thumb(name, page=2)
+    return _take_image(img_url, used_image_urls, page2_url)
+
+
+def _fix_recs(recs: List[Dict]) -> List[Dict]:
+    items, names, named = _rec_items(recs)
+    out = []
+    with ThreadPoolExecutor(max_workers=ENRICH_WORKERS) as pool:
+        url_futures = {
+            i: pool.submit(_resolve_rec_url, names[i], (items[i].get("url") or "").strip())
+            for i in named
+        }
+        thumb_futures = {i: pool.submit(_unsplash_thumb, names[i], 1) for i in named}
+        first_thumbs = {i: f.result() for i, f in thumb_futures.items()}
+        page2_futures = {i: pool.submit(_unsplash_thumb, names[i], 2) for i in _page2_needed(named, first_thumbs)}
+
+        used_image_urls = set()
+        for i, r_item in enumerate(items):
+            name = names[i]
+            if not name:
+                out.append(_unnamed_rec(r_item))
+                continue
+
+            r_item["url"] = url_futures[i].result() or _amazon_search(name)
+            r_item["img"] = _pick_image(name, first_thumbs[i], used_image_urls, page2_futures.get(i))
+            out.append(r_item)
     return out
 
 
-def infer_user_profile(cleaned_prompt: str) -> Dict:
-    try:
-        response = client.chat.completions.create(
-            model="o4-mini-2025-04-16", 
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user",   "content": cleaned_prompt},
-            ],
-            response_format={"type": "json_object"},
-        )
-        reply = response.choices[0].message.content.strip()
-    except Exception as e:
-        return {"raw_response": "", "error": f"OpenAI API call failed: {str(e)}", "profile": {}, "recommendations": []}
-    
+class _RecEnricher:
+    """Incremental _fix_recs: takes recommendations as they arrive and hands back ready events in order."""
+
+    def __init__(self, pool: ThreadPoolExecutor):
+        self.pool = pool
+        self.items: List[Dict] = []
+        self.names: List[str] = []
+        self.url_futures = {}
+        self.thumb_futures = {}
+        self.used_image_urls = set()
+        self.next_rec = 0
+        self.next_img = 0
+
+    def add(self, r_item: Dict) -> None:
+        i = len(self.items)
+        name = (r_item.get("name") or "").strip()
+        self.items.append(r_item)
+        self.names.append(name)
+        if name:
+            self.url_futures[i] = self.pool.submit(_resolve_rec_url, name, (r_item.get("url") or "").strip())
+            self.thumb_futures[i] = self.pool.submit(_unsplash_thumb, name, 1)
+
+    def drain(self, final: bool) -> Iterator[Dict]:
+        while self.next_rec < len(self.items):
+            i = self.next_rec
+            fut = self.url_futures.get(i)
+            if fut is not None and not (final or fut.done()):
+                break
+            r_item = self.items[i]
+            if fut is None:
+                _unnamed_rec(r_item)
+            else:
+                r_item["url"] = fut.result() or _amazon_search(self.names[i])
+            self.next_rec += 1
+            yield {"event": "recommendation", "index": i, "recommendation": dict(r_item)}
+
+        # images are settled strictly in card order so the dedup matches _fix_recs
+        while self.next_img < self.next_rec:
+            i = self.next_img
+            fut = self.thumb_futures.get(i)
+            if fut is not None and not (final or fut.done()):
+                break
+            if fut is not None:
+                self.items[i]["img"] = _pick_image(self.names[i], fut.result(), self.used_image_urls)
+            self.next_img += 1
+            yield {"event": "image", "index": i, "img": self.items[i]["img"]}
+
+
+class _ReplyScanner:
+    """Pulls the 'profile' object and each finished 'recommendations' item out of a partial JSON reply."""
+
+    def __init__(self):
+        self.text = ""
+        self.profile: Optional[Dict] = None
+        self.recs: List[Dict] = []
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._top_key: Optional[str] = None
+        self._value_start = 0
+        self._item_start = 0
+
+    def _load(self, start: int, end: int):
+        try:
+            value = json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
+
+    def feed(self, delta: str) -> None:
+        self.text += delta
+        for i in range(self._pos, len(self.text)):
+            c = self.text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = self.text[self._string_start:i + 1]
+                continue
+            depth = len(self._stack)
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and depth == 1:
+                try:
+                    self._top_key = json.loads(self._last_string)
+                except json.JSONDecodeError:
+                    self._top_key = None
+            elif c in "{[":
+                self._stack.append(c)
+                if depth == 1:
+                    self._value_start = i
+                elif depth == 2 and c == "{" and self._top_key == "recommendations" and self._stack[1] == "[":
+                    self._item_start = i
+            elif c in "}]" and self._stack:
+                if depth == 2 and c == "}" and self._top_key == "profile" and self.profile is None:
+                    self.profile = self._load(self._value_start, i + 1)
+                elif depth == 3 and c == "}" and self._top_key == "recommendations" and self._stack[1] == "[":
+                    item = self._load(self._item_start, i + 1)
+                    if item is not None:
+                        self.recs.append(item)
+                self._stack.pop()
+        self._pos = len(self.text)
+
+
+_PROFILE_SCHEMA = {
+    "age": {"type": "string", "options": AGE_RANGES},
+    "gender": {"type": "string", "options": GENDER_OPTIONS},
+    "profession": {"type": "string", "options": PROFESSION_OPTIONS},
+    "lifestyle": {"type": "list", "options": LIFESTYLE_OPTIONS},
+    "personality": {"type": "list", "options": PERSONALITY_OPTIONS},
+    "hobbies": {"type": "list", "options": HOBBY_OPTIONS},
+    "shopping_style": {"type": "list", "options": SHOPPING_STYLE_OPTIONS},
+}
+
+
+def _parse_reply(reply: str) -> Dict:
     data: Dict = {}
     try:
         data = json.loads(reply)
     except json.JSONDecodeError:
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", reply, re.MULTILINE)
-        if match:
-            try:
-                data = json.loads(match.group(1))
-            except json.JSONDecodeError:
-                 return {"raw_response": reply, "error": "GPT returned non-JSON content even after markdown extraction.", "profile": {}, "recommendations": []}
-        else:
-            return {"raw_response": reply, "error": "GPT returned non-JSON content.", "profile": {}, "recommendations": []}
-
-    if "profile" not in data or not isinstance(data.get("profile"), dict):
-        data["profile"] = {}
-
-    profile_schema = {
-        "age": {"type": "string", "options": AGE_RANGES},
-        "gender": {"type": "string", "options": GENDER_OPTIONS},
-        "profession": {"type": "string", "options": PROFESSION_OPTIONS},
-        "lifestyle": {"type": "list", "options": LIFESTYLE_OPTIONS},
-        "personality": {"type": "list", "options": PERSONALITY_OPTIONS},
-        "hobbies": {"type": "list", "options": HOBBY_OPTIONS},
-        "shopping_style": {"type": "list", "options": SHOPPING_STYLE_OPTIONS},
-    }
+        registry.inc("json_repair_total")
+        with span("json_repair"):
+            match = re.search(r"```json\s*([\s\S]*?)\s*```", reply, re.MULTILINE)
+            if match:
+                try:
+                    data = json.loads(match.group(1))
+                except json.JSONDecodeError:
+                     return {"raw_response": reply, "error": "GPT returned non-JSON content even after markdown extraction.", "profile": {}, "recommendations": []}
+            else:
+                return {"raw_response": reply, "error": "GPT returned non-JSON content.", "profile": {}, "recommendations": []}
+    if not isinstance(data, dict):
+        return {"raw_response": reply, "error": "GPT returned non-JSON content.", "profile": {}, "recommendations": []}
+    return data
+
+
+@span("schema_validation")
+def _validate_profile(profile_from_gpt) -> Dict:
+    if not isinstance(profile_from_gpt, dict):
+        profile_from_gpt = {}
 
     cleaned_profile = {}
-    profile_from_gpt = data.get("profile", {})
-    for key, schema_info in profile_schema.items():
+    for key, schema_info in _PROFILE_SCHEMA.items():
         value = profile_from_gpt.get(key)
         if schema_info["type"] == "string":
             if isinstance(value, str) and value in schema_info["options"]:
@@ -216,11 +501,181 @@ def infer_user_profile(cleaned_prompt: str) -> Dict:
                  cleaned_profile[key] = [v.strip() for v in value.split(',') if v.strip() in schema_info["options"]]
             else: 
                 cleaned_profile[key] = []
-    data["profile"] = cleaned_profile
+    return cleaned_profile
+
+
+def _messages(cleaned_prompt: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user",   "content": cleaned_prompt},
+    ]
+
+
+def _delta_messages(previous_profile: Dict, new_orders_prompt: str) -> List[Dict]:
+    update = json.dumps({"previous_profile": previous_profile}, separators=(",", ":"))
+    return [
+        {"role": "system", "content": DELTA_SYSTEM_PROMPT},
+        {"role": "user",   "content": f"{update}\nnew_orders:\n{new_orders_prompt}"},
+    ]
 
-    if "recommendations" in data and isinstance(data["recommendations"], list):
-        data["recommendations"] = _fix_recs(data["recommendations"])
-    else: 
-        data["recommendations"] = _fix_recs(data.get("recommendations", []))
 
-    return data
\ No newline at end of file
+def _merge_known(profile: Dict, known_traits: Dict) -> Dict:
+    merged = dict(profile)
+    for key, value in _validate_profile(known_traits).items():
+        if key not in known_traits:
+            continue
+        if isinstance(value, list):
+            merged[key] = value + [v for v in merged.get(key, []) if v not in value]
+        else:
+            merged[key] = value
+    return merged
+
+
+def _profile_request(cleaned_prompt: str, known_traits: Optional[Dict] = None):
+    """(messages, cache key, keys of cached replies that answer it too)."""
+    full_key = content_key(cleaned_prompt, SYSTEM_PROMPT, MODEL)
+    if not known_traits:
+        return _messages(cleaned_prompt), full_key, ()
+    settled = json.dumps(known_traits, separators=(",", ":"), sort_keys=True)
+    system_prompt = _fill_system_prompt([trait for trait in _PROFILE_SCHEMA if trait not in known_traits])
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": f"Already determined, keep as is: {settled}\nOrders:\n{cleaned_prompt}"},
+    ]
+    # a full profile of the same orders answers a fill as well, once the settled traits are merged in
+    return messages, content_key(messages[1]["content"], system_prompt, MODEL), (full_key,)
+
+
+def infer_user_profile(cleaned_prompt: str, use_cache: bool = True, known_traits: Optional[Dict] = None) -> Dict:
+    """``known_traits`` (e.g. from rule_profiler) are given to the model as settled and kept in the result."""
+    messages, cache_key, also_cached = _profile_request(cleaned_prompt, known_traits)
+    data = _complete_profile(messages, cache_key, use_cache, also_cached)
+    if known_traits and "error" not in data:
+        data["profile"] = _merge_known(data.get("profile", {}), known_traits)
+    return data
+
+
+def update_user_profile(previous_profile: Dict, new_orders_prompt: str, use_cache: bool = True) -> Dict:
+    """Merge orders placed since ``previous_profile`` was inferred; same result shape as infer_user_profile."""
+    messages = _delta_messages(_validate_profile(previous_profile), new_orders_prompt)
+    cache_key = content_key(messages[1]["content"], DELTA_SYSTEM_PROMPT, MODEL)
+    return _complete_profile(messages, cache_key, use_cache)
+
+
+def _complete_profile(messages: List[Dict], cache_key: str, use_cache: bool, also_cached: Sequence[str] = ()) -> Dict:
+    if use_cache:
+        for key in (*also_cached, cache_key):
+            cached = _get_result_cache().get(key)
+            if cached is not None:
+                return cached
+
+    try:
+        with span("llm_call"):
+            response = _chat(
+                model=MODEL, 
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+        reply = response.choices[0].message.content.strip()
+    except Exception as e:
+        return {"raw_response": "", "error": f"OpenAI API call failed: {str(e)}", "profile": {}, "recommendations": []}
+
+    data = _parse_reply(reply)
+    if "error" in data:
+        return data
+
+    data["profile"] = _validate_profile(data.get("profile"))
+    data["recommendations"] = _fix_recs(data.get("recommendations", []))
+
+    if use_cache:
+        _get_result_cache().put(cache_key, data)
+    return data
+
+
+def replay_events(data: Dict) -> Iterator[Dict]:
+    if "error" in data:
+        yield {"event": "error", "error": data["error"], "raw_response": data.get("raw_response", "")}
+    else:
+        yield {"event": "profile", "profile": data.get("profile", {})}
+        for i, rec in enumerate(data.get("recommendations", [])):
+            yield {"event": "recommendation", "index": i, "recommendation": dict(rec)}
+        for i, rec in enumerate(data.get("recommendations", [])):
+            yield {"event": "image", "index": i, "img": rec.get("img", _PLACEHOLDER)}
+    yield {"event": "done", "data": data}
+
+
+def stream_user_profile(cleaned_prompt: str, use_cache: bool = True) -> Iterator[Dict]:
+    """Streaming infer_user_profile: ``profile``, then ``recommendation``/``image`` per card, then ``done`` (``error`` first on failure)."""
+    cache_key = content_key(cleaned_prompt, SYSTEM_PROMPT, MODEL)
+    if use_cache:
+        cached = _get_result_cache().get(cache_key)
+        if cached is not None:
+            yield from replay_events(cached)
+            return
+
+    scanner = _ReplyScanner()
+    profile = None
+    pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS)
+    enricher = _RecEnricher(pool)
+    # the streamed call is timed by hand: a span can't stay open across yields
+    llm_start = time.perf_counter()
+    try:
+        try:
+            chunks = iter(_chat(
+                model=MODEL,
+                messages=_messages(cleaned_prompt),
+                response_format={"type": "json_object"},
+                stream=True,
+            ))
+        except Exception as e:
+            chunks = None
+            failure = e
+        while chunks is not None:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except Exception as e:
+                chunks = None
+                failure = e
+                break
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if not scanner.text:
+                registry.observe("llm_first_token_seconds", time.perf_counter() - llm_start)
+            scanner.feed(delta)
+            if profile is None and scanner.profile is not None:
+                profile = _validate_profile(scanner.profile)
+                yield {"event": "profile", "profile": profile}
+            while len(enricher.items) < len(scanner.recs):
+                enricher.add(scanner.recs[len(enricher.items)])
+            yield from enricher.drain(final=False)
+
+        registry.observe("stage_seconds", time.perf_counter() - llm_start, stage="llm_call")
+        if chunks is None:
+            registry.inc("stage_errors_total", stage="llm_call")
+            yield from replay_events({"raw_response": "", "error": f"OpenAI API call failed: {str(failure)}", "profile": {}, "recommendations": []})
+            return
+
+        data = _parse_reply(scanner.text.strip())
+        if "error" in data:
+            yield from replay_events(data)
+            return
+
+        if profile is None:
+            profile = _validate_profile(data.get("profile"))
+            yield {"event": "profile", "profile": profile}
+        recs = data.get("recommendations", [])
+        recs = [r_item for r_item in recs if isinstance(r_item, dict)] if isinstance(recs, list) else []
+        for r_item in recs[len(enricher.items):]:
+            enricher.add(r_item)
+        yield from enricher.drain(final=True)
+
+        data["profile"] = profile
+        data["recommendations"] = enricher.items
+        if use_cache:
+            _get_result_cache().put(cache_key, data)
+        yield {"event": "done", "data": data}
+    finally:
+        pool.shutdown(wait=False)
@@ -0,0 +1,192 @@
+"""asyncio versions of infer_user_profile and its enrichment; infer_user_profiles() runs many from sync code."""
+from __future__ import annotations
+
+import asyncio, os, weakref
+from typing import Dict, List, Optional, Sequence
+
+from gpt_infer import (
+    MODEL, UA, _amazon_search, _cached_dp, _ddg_search_url, _dp_from_search_html, _env, _get_result_cache,
+    _get_scheduler, _get_transport, _is_amazon_domain, _is_amazon_product_page, _merge_known, _page2_needed,
+    _parse_reply, _profile_request, _rec_items, _store_dp, _take_image, _unnamed_rec, _unsplash_params,
+    _validate_profile,
+)
+from metrics import span
+
+# set to an AsyncOpenAI-compatible object to bypass the per-loop clients (tests, benchmarks)
+aclient = None
+_loop_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_loop_http: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+DEFAULT_CONCURRENCY = 32
+
+
+def _aclient():
+    if aclient is not None:
+        return aclient
+    # httpx-backed clients can't be shared across event loops, so each loop gets its own
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop)
+    if client is None:
+        import openai
+        client = _loop_clients[loop] = openai.AsyncOpenAI(api_key=_env("OPENAI_API_KEY"))
+    return client
+
+
+def _ahttp():
+    from http_pool import AsyncHttpPool
+
+    loop = asyncio.get_running_loop()
+    pool = _loop_http.get(loop)
+    if pool is None:
+        pool = _loop_http[loop] = AsyncHttpPool(
+            max_per_host=int(os.getenv("HTTP_MAX_PER_HOST", "4")),
+            retries=int(os.getenv("HTTP_RETRIES", "2")),
+        )
+    return pool
+
+
+async def aclose() -> None:
+    """Close the clients opened on the running loop."""
+    loop = asyncio.get_running_loop()
+    pool = _loop_http.pop(loop, None)
+    if pool is not None:
+        await pool.aclose()
+    client = _loop_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
+
+
+async def _ahttp_get(url: str, **kwargs):
+    params = kwargs.get("params")
+    return await _get_scheduler().aget(url, params, lambda: _get_transport().aget(lambda: _ahttp().get(url, **kwargs), url, params))
+
+
+async def _afirst_amazon_dp(keyword: str) -> Optional[str]:
+    if not keyword:
+        return None
+    # SQLite, so off the event loop like the result cache below
+    cached, dp_url = await asyncio.to_thread(_cached_dp, keyword)
+    if cached:
+        return dp_url
+    try:
+        with span("asin_lookup"):
+            resp = await _ahttp_get(_ddg_search_url(keyword), headers=UA, timeout=7)
+        dp_url = _dp_from_search_html(resp.text)
+        if dp_url or resp.status_code == 200:
+            await asyncio.to_thread(_store_dp, keyword, dp_url)
+        return dp_url
+    except Exception:
+        return None
+
+
+async def _aunsplash_thumb(keyword: str, page: int = 1) -> Optional[str]:
+    unsplash_key = _env("UNSPLASH_KEY")
+    if not unsplash_key or not keyword:
+        return None
+    try:
+        with span("thumbnail_lookup", page=page):
+            r = await _ahttp_get(
+                "https://api.unsplash.com/search/photos",
+                params=_unsplash_params(keyword, page),
+                headers={"Authorization": f"Client-ID {unsplash_key}", **UA},
+                timeout=4,
+            )
+            r.raise_for_status()
+        hits = r.json().get("results", [])
+        return hits[0]["urls"]["thumb"] if hits else None
+    except Exception:
+        return None
+
+
+async def _aresolve_rec_url(name: str, original_url: str) -> str:
+    if _is_amazon_product_page(original_url):
+        return original_url
+    dp_link = await _afirst_amazon_dp(name)
+    if dp_link:
+        return dp_link
+    if _is_amazon_domain(original_url) and original_url:
+        return original_url
+    return _amazon_search(name)
+
+
+async def afix_recs(recs: List[Dict]) -> List[Dict]:
+    """_fix_recs with every lookup awaited concurrently; same output for the same lookups."""
+    items, names, named = _rec_items(recs)
+    urls = {i: asyncio.ensure_future(_aresolve_rec_url(names[i], (items[i].get("url") or "").strip())) for i in named}
+    thumbs = await asyncio.gather(*(_aunsplash_thumb(names[i], 1) for i in named))
+    first_thumbs = dict(zip(named, thumbs))
+    page2 = {i: asyncio.ensure_future(_aunsplash_thumb(names[i], 2)) for i in _page2_needed(named, first_thumbs)}
+
+    out = []
+    used_image_urls = set()
+    for i, r_item in enumerate(items):
+        name = names[i]
+        if not name:
+            out.append(_unnamed_rec(r_item))
+            continue
+
+        r_item["url"] = (await urls[i]) or _amazon_search(name)
+        img_url = first_thumbs[i]
+        page2_url = None
+        if img_url and img_url in used_image_urls:
+            page2_url = await page2[i] if i in page2 else await _aunsplash_thumb(name, 2)
+        r_item["img"] = _take_image(img_url, used_image_urls, page2_url)
+        out.append(r_item)
+    return out
+
+
+async def ainfer_user_profile(cleaned_prompt: str, use_cache: bool = True, known_traits: Optional[Dict] = None) -> Dict:
+    messages, cache_key, also_cached = _profile_request(cleaned_prompt, known_traits)
+    data = await _acomplete_profile(messages, cache_key, use_cache, also_cached)
+    if known_traits and "error" not in data:
+        data["profile"] = _merge_known(data.get("profile", {}), known_traits)
+    return data
+
+
+async def _acomplete_profile(messages: List[Dict], cache_key: str, use_cache: bool,
+                             also_cached: Sequence[str] = ()) -> Dict:
+    if use_cache:
+        for key in (*also_cached, cache_key):
+            cached = await asyncio.to_thread(_get_result_cache().get, key)
+            if cached is not None:
+                return cached
+
+    try:
+        with span("llm_call"):
+            response = await _get_transport().achat(
+                lambda **kw: _aclient().chat.completions.create(**kw),
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+        reply = response.choices[0].message.content.strip()
+    except Exception as e:
+        return {"raw_response": "", "error": f"OpenAI API call failed: {str(e)}", "profile": {}, "recommendations": []}
+
+    data = _parse_reply(reply)
+    if "error" in data:
+        return data
+
+    data["profile"] = _validate_profile(data.get("profile"))
+    data["recommendations"] = await afix_recs(data.get("recommendations", []))
+
+    if use_cache:
+        await asyncio.to_thread(_get_result_cache().put, cache_key, data)
+    return data
+
+
+def infer_user_profiles(prompts: Sequence[str], concurrency: int = DEFAULT_CONCURRENCY,
+                        use_cache: bool = True) -> List[Dict]:
+    """Profile many prompts from sync code on one event loop, at most ``concurrency`` at a time."""
+
+    async def run() -> List[Dict]:
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(prompt: str) -> Dict:
+            async with gate:
+                return await ainfer_user_profile(prompt, use_cache=use_cache)
+        try:
+            return await asyncio.gather(*(one(p) for p in prompts))
+        finally:
+            await aclose()
+
+    return asyncio.run(run())
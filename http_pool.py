@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio, os, threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import registry
+
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+# both pools count http_requests_total and http_connections_total per host into the metrics
+# registry; requests beyond connections rode keep-alive
+
+
+class HttpPool:
+    """Shared keep-alive session with per-host pools, transient-only retries and a per-host concurrency cap."""
+
+    def __init__(self, max_per_host: int = 4, pool_maxsize: int = 16, retries: int = 2,
+                 backoff: float = 0.3, headers: Optional[Dict[str, str]] = None):
+        self.max_per_host = max_per_host
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=TRANSIENT_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+        if headers:
+            self._session.headers.update(headers)
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+        # (requests, connections) per host as of the last _publish
+        self._published: Dict[str, Tuple[int, int]] = {}
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        with self._slot(host):
+            with self._lock:
+                self._in_flight[host] += 1
+            try:
+                return self._session.get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                with self._lock:
+                    self._errors[host] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight[host] -= 1
+                self._publish()
+
+    def _publish(self) -> None:
+        deltas = []
+        stats = self.stats()
+        with self._lock:
+            for host, entry in stats.items():
+                requests_seen, connections_seen = self._published.get(host, (0, 0))
+                # a thread holding older stats mustn't move the counters backwards
+                requests_now = max(entry["requests"], requests_seen)
+                connections_now = max(entry["connections"], connections_seen)
+                self._published[host] = (requests_now, connections_now)
+                deltas.append((host, requests_now - requests_seen, connections_now - connections_seen))
+        for host, new_requests, new_connections in deltas:
+            if new_requests:
+                registry.inc("http_requests_total", new_requests, host=host, client="sync")
+            if new_connections:
+                registry.inc("http_connections_total", new_connections, host=host, client="sync")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        # urllib3 counts every new socket (and so every TCP/TLS handshake) in
+        # num_connections; anything above that in num_requests rode keep-alive.
+        out: Dict[str, Dict[str, int]] = {}
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = out.setdefault(host, {"requests": 0, "connections": 0, "reused": 0, "in_flight": 0, "errors": 0})
+            entry["requests"] += pool.num_requests
+            entry["connections"] += pool.num_connections
+            entry["reused"] = max(entry["requests"] - entry["connections"], 0)
+        with self._lock:
+            for host, entry in out.items():
+                entry["in_flight"] = self._in_flight.get(host, 0)
+                entry["errors"] = self._errors.get(host, 0)
+        return out
+
+
+class AsyncHttpPool:
+    """httpx.AsyncClient counterpart of HttpPool; bound to the event loop it is first used on."""
+
+    def __init__(self, max_per_host: int = 4, pool_maxsize: int = 16, retries: int = 2,
+                 backoff: float = 0.3, headers: Optional[Dict[str, str]] = None):
+        import httpx
+
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            headers=headers,
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            transport=httpx.AsyncHTTPTransport(retries=retries),  # connect errors only
+        )
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._requests: Dict[str, int] = defaultdict(int)
+        self._connections: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+
+    async def get(self, url: str, **kwargs):
+        import httpx
+
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+
+        async def trace(event: str, info: Dict) -> None:
+            # httpcore reports each new socket, and so each TCP/TLS handshake, here
+            if event == "connection.connect_tcp.complete":
+                self._connections[host] += 1
+                registry.inc("http_connections_total", host=host, client="async")
+
+        async with slot:
+            self._in_flight[host] += 1
+            try:
+                for attempt in range(self.retries + 1):
+                    self._requests[host] += 1
+                    registry.inc("http_requests_total", host=host, client="async")
+                    resp = await self._client.get(url, extensions={"trace": trace}, **kwargs)
+                    if resp.status_code not in TRANSIENT_STATUSES or attempt == self.retries:
+                        return resp
+                    retry_after = resp.headers.get("Retry-After", "")
+                    await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt)
+            except httpx.HTTPError:
+                self._errors[host] += 1
+                raise
+            finally:
+                self._in_flight[host] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            host: {"requests": n, "connections": self._connections.get(host, 0),
+                   "reused": max(n - self._connections.get(host, 0), 0),
+                   "in_flight": self._in_flight.get(host, 0), "errors": self._errors.get(host, 0)}
+            for host, n in self._requests.items()
+        }
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+http = HttpPool(
+    max_per_host=int(os.getenv("HTTP_MAX_PER_HOST", "4")),
+    retries=int(os.getenv("HTTP_RETRIES", "2")),
+)
@@ -0,0 +1,106 @@
+"""Re-profile a customer from a re-uploaded export, sending only the orders added since last time.
+
+    python incremental.py export.csv [--customer ID] [--state-dir DIR]
+"""
+from __future__ import annotations
+
+import argparse, json, os, sys, time
+from typing import Dict, Optional
+
+import pandas as pd
+
+from result_cache import DiskBackend, content_key
+
+DEFAULT_STATE_DIR = os.path.join(".cache", "customers")
+# a dropped state only costs the next upload a full run
+MAX_CUSTOMERS = 1_000_000
+
+
+def customer_fingerprint(file_path) -> str:
+    """Stable id for an export: its earliest Order ID, which every later re-export still contains."""
+    from data.data_cleaner import ORDER_ID
+
+    df = pd.read_csv(file_path, usecols=[ORDER_ID, "Order Date"], dtype=str)
+    if hasattr(file_path, "seek"):
+        file_path.seek(0)
+    df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
+    df = df.dropna().sort_values(["Order Date", ORDER_ID])
+    if df.empty:
+        raise ValueError("No dated orders to identify the customer by")
+    return content_key(df[ORDER_ID].iloc[0])
+
+
+class CustomerStateStore:
+    def __init__(self, directory: str = DEFAULT_STATE_DIR):
+        self._backend = DiskBackend(directory, max_entries=MAX_CUSTOMERS)
+
+    def get(self, customer_id: str) -> Optional[Dict]:
+        return self._backend.get(content_key("customer", customer_id))
+
+    def put(self, customer_id: str, state: Dict) -> None:
+        self._backend.put(content_key("customer", customer_id), state)
+
+
+def reprofile(file_path, customer_id: Optional[str] = None, store: Optional[CustomerStateStore] = None,
+              max_prompt_chars: Optional[int] = None) -> Dict:
+    """infer_user_profile for a re-upload; adds an "incremental" summary to the usual result dict."""
+    from data.data_cleaner import clean_new_orders
+    from data.prompt_compactor import compact_prompt
+    from gpt_infer import infer_user_profile, update_user_profile
+
+    store = store or CustomerStateStore()
+    customer_id = customer_id or customer_fingerprint(file_path)
+    previous = store.get(customer_id)
+
+    start = time.perf_counter()
+    prompt, cleaner_state = clean_new_orders(file_path, previous["cleaner"] if previous else None)
+    clean_s = time.perf_counter() - start
+    summary = {
+        "customer_id": customer_id,
+        "mode": "delta" if previous else "full",
+        "new_order_lines": len(prompt.splitlines()),
+        "clean_s": clean_s,
+    }
+
+    if previous and not prompt.strip():
+        summary.update(mode="unchanged", prompt_chars=0)
+        return {"profile": previous["profile"], "recommendations": previous["recommendations"], "incremental": summary}
+    if not prompt.strip():
+        return {"error": "The processed CSV file resulted in no data to analyze.", "profile": {},
+                "recommendations": [], "incremental": summary}
+
+    if max_prompt_chars:
+        prompt = compact_prompt(prompt, max_chars=max_prompt_chars)[0]
+    summary["prompt_chars"] = len(prompt)
+    if previous:
+        data = update_user_profile(previous["profile"], prompt)
+    else:
+        data = infer_user_profile(prompt)
+
+    # only a successful call advances the state, so a failed update resends the same orders next time
+    if not data.get("error"):
+        store.put(customer_id, {
+            "customer_id": customer_id,
+            "cleaner": cleaner_state,
+            "profile": data.get("profile", {}),
+            "recommendations": data.get("recommendations", []),
+            "updated_at": time.time(),
+        })
+    return {**data, "incremental": summary}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv")
+    parser.add_argument("--customer", help="customer id; defaults to a fingerprint of the export")
+    parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR)
+    parser.add_argument("--max-prompt-chars", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    data = reprofile(args.csv, args.customer, CustomerStateStore(args.state_dir), args.max_prompt_chars)
+    print(json.dumps(data, indent=2, ensure_ascii=False))
+    return 1 if data.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
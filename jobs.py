@@ -0,0 +1,129 @@
+"""Background profiling jobs for the Streamlit app, with their status and progress kept in a DiskBackend."""
+from __future__ import annotations
+
+import copy, hashlib, io, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from metrics import registry
+from result_cache import DiskBackend, content_key
+
+DEFAULT_JOB_DIR = os.path.join(".cache", "jobs")
+DEFAULT_WORKERS = 4
+MAX_JOBS = 1_000
+# a queued or running record left behind by an earlier server process reads as "interrupted"
+ACTIVE = ("queued", "running")
+
+Progress = Callable[[Dict], None]
+
+
+def job_id_for(upload_bytes: bytes, max_prompt_chars: Optional[int]) -> str:
+    return content_key("profile-job", hashlib.sha256(upload_bytes).hexdigest(), str(max_prompt_chars))
+
+
+def profile_upload(upload_bytes: bytes, progress: Progress, max_prompt_chars: Optional[int] = None) -> Dict:
+    """What app.py used to do inline: clean, compact, then stream the profile into the job record."""
+    from data.data_cleaner import clean_order_csv
+    from data.prompt_compactor import compact_prompt
+    from gpt_infer import _PLACEHOLDER, stream_user_profile
+    from split_infer import hedge_after_from_env, mode_from_env, stream_user_profile_split
+    from thumbnails import get_cache
+
+    progress({"stage": "cleaning"})
+    prompt_text = clean_order_csv(io.BytesIO(upload_bytes))
+    order_lines = len(prompt_text.splitlines())
+    compaction = None
+    if max_prompt_chars and len(prompt_text) > max_prompt_chars:
+        prompt_text, compaction = compact_prompt(prompt_text, max_chars=max_prompt_chars)
+    progress({"stage": "profiling", "order_lines": order_lines, "prompt_chars": len(prompt_text),
+              "compaction": compaction})
+    if not prompt_text.strip():
+        raise ValueError("The processed CSV file resulted in no data to analyze.")
+
+    split_mode = mode_from_env()
+    if split_mode:
+        events = stream_user_profile_split(prompt_text, split_mode, hedge_after_from_env())
+    else:
+        events = stream_user_profile(prompt_text)
+    recommendations = []
+    for event in events:
+        if event["event"] == "profile":
+            progress({"profile": event["profile"]})
+        elif event["event"] == "recommendation":
+            recommendations.append(event["recommendation"])
+            progress({"recommendations": list(recommendations)})
+        elif event["event"] == "image":
+            # fetched in the background so the page finds it cached; the placeholder is drawn locally
+            if event["img"] != _PLACEHOLDER:
+                get_cache().prefetch(event["img"])
+            recommendations[event["index"]] = dict(recommendations[event["index"]], img=event["img"])
+            progress({"recommendations": list(recommendations)})
+        elif event["event"] == "done":
+            return event["data"]
+    return {"error": "Profiling stopped before it finished.", "profile": {}, "recommendations": []}
+
+
+class JobQueue:
+    def __init__(self, directory: str = DEFAULT_JOB_DIR, workers: int = DEFAULT_WORKERS):
+        self._store = DiskBackend(directory, max_entries=MAX_JOBS)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profile-job")
+        self._lock = threading.Lock()
+        # records of jobs queued or running in this process; polled without touching disk
+        self._live: Dict[str, Dict] = {}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._live.get(job_id)
+            if record is not None:
+                return copy.deepcopy(record)
+        record = self._store.get(job_id)
+        if record is not None and record["status"] in ACTIVE:
+            record["status"] = "interrupted"
+        return record
+
+    def submit(self, job_id: str, fn: Callable[..., Dict], *args, **kwargs) -> Dict:
+        """Run ``fn(*args, progress=..., **kwargs)`` as job ``job_id`` unless that job is live or done."""
+        with self._lock:
+            if job_id in self._live:
+                return copy.deepcopy(self._live[job_id])
+            previous = self._store.get(job_id)
+            if previous is not None and previous["status"] == "done" and not (previous["result"] or {}).get("error"):
+                return previous
+            record = self._live[job_id] = {
+                "id": job_id, "status": "queued", "stage": None, "submitted_at": time.time(),
+                "started_at": None, "finished_at": None, "error": None, "result": None,
+            }
+            self._store.put(job_id, record)
+            snapshot = copy.deepcopy(record)
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+        return snapshot
+
+    def _update(self, job_id: str, changes: Dict) -> None:
+        with self._lock:
+            record = self._live[job_id]
+            record.update(copy.deepcopy(changes))
+            snapshot = copy.deepcopy(record)
+        self._store.put(job_id, snapshot)
+        # dropped only once on disk, so get() never sees a stale running record in between
+        if snapshot["status"] not in ACTIVE:
+            with self._lock:
+                del self._live[job_id]
+
+    def _run(self, job_id: str, fn: Callable[..., Dict], args, kwargs) -> None:
+        self._update(job_id, {"status": "running", "started_at": time.time()})
+        try:
+            result = fn(*args, progress=lambda changes: self._update(job_id, changes), **kwargs)
+        except Exception as e:
+            status = "failed"
+            self._update(job_id, {"status": status, "error": str(e), "finished_at": time.time()})
+        else:
+            status = "done"
+            self._update(job_id, {"status": status, "result": result, "finished_at": time.time()})
+        registry.inc("profile_jobs_total", status=status)
+        # the app has no --metrics flag; METRICS_PATH gets this process's registry after every job
+        metrics_path = os.getenv("METRICS_PATH")
+        if metrics_path:
+            registry.dump(metrics_path)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
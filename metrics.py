@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import bisect, json, math, os, threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+PREFIX = "profiling_"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms keyed by name + labels; dumpable as JSON or Prometheus text."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels) -> Iterator[None]:
+        """Time a pipeline stage into stage_seconds{stage=...}; failures also count stage_errors_total."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            gauges = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._gauges.items()
+            }
+            histograms = {
+                name: [{
+                    "labels": dict(key),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "max": h.max,
+                    "p50": h.quantile(0.5),
+                    "p90": h.quantile(0.9),
+                    "p99": h.quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], _cumulative(h.counts))),
+                } for key, h in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def merge(self, snapshot: Dict) -> None:
+        """Fold in another registry's snapshot(), e.g. one returned from a worker process."""
+        for name, series in snapshot.get("counters", {}).items():
+            for entry in series:
+                self.inc(name, entry["value"], **entry["labels"])
+        # gauges from separate processes measure separate things, so they add up
+        for name, series in snapshot.get("gauges", {}).items():
+            for entry in series:
+                key = _label_key(entry["labels"])
+                with self._lock:
+                    gauge_series = self._gauges.setdefault(name, {})
+                    gauge_series[key] = gauge_series.get(key, 0.0) + entry["value"]
+        for name, series in snapshot.get("histograms", {}).items():
+            for entry in series:
+                key = _label_key(entry["labels"])
+                cumulative = list(entry["buckets"].values())
+                counts = [b - a for a, b in zip([0] + cumulative[:-1], cumulative)]
+                with self._lock:
+                    hist = self._histograms.setdefault(name, {}).get(key)
+                    if hist is None:
+                        hist = self._histograms[name][key] = _Histogram(self.buckets)
+                    if len(counts) != len(hist.counts):
+                        raise ValueError(f"Bucket layout mismatch while merging {name}")
+                    hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                    hist.sum += entry["sum"]
+                    hist.count += entry["count"]
+                    hist.max = max(hist.max, entry["max"])
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = PREFIX + name
+                out.append(f"# TYPE {metric} counter")
+                for key, value in sorted(series.items()):
+                    out.append(f"{metric}{_prom_labels(key)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                metric = PREFIX + name
+                out.append(f"# TYPE {metric} gauge")
+                for key, value in sorted(series.items()):
+                    out.append(f"{metric}{_prom_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                metric = PREFIX + name
+                out.append(f"# TYPE {metric} histogram")
+                for key, h in sorted(series.items()):
+                    for bound, cumulative in zip(list(self.buckets) + ["+Inf"], _cumulative(h.counts)):
+                        le = bound if isinstance(bound, str) else f"{bound:g}"
+                        out.append(f"{metric}_bucket{_prom_labels(key + (('le', le),))} {cumulative}")
+                    out.append(f"{metric}_sum{_prom_labels(key)} {h.sum:.6f}")
+                    out.append(f"{metric}_count{_prom_labels(key)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write a .json snapshot, or Prometheus text exposition for any other extension."""
+        text = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        # replaced whole, so a scraper or a concurrent dump never sees half a file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def _cumulative(counts: List[int]) -> List[int]:
+    total, out = 0, []
+    for n in counts:
+        total += n
+        out.append(total)
+    return out
+
+
+def _prom_labels(key: _LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+registry = MetricsRegistry()
+span = registry.span
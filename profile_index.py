@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from profile_store import COLUMN_DTYPES, SINGLE_TRAITS, TRAITS, UNKNOWN_CODES, ProfileStore, encode_profile
+
+DEFAULT_WEIGHTS: Dict[str, float] = {name: 1.0 for name in TRAITS}
+# upper bound on query x row cells scored at once, to cap temporary memory
+BLOCK_CELLS = 1 << 22
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # numpy < 2.0
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        return _BYTE_POPCOUNT[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+class SimilarityIndex:
+    """Top-k most similar profiles by weighted Jaccard over (trait, option) sets; "Unknown" answers are left out."""
+
+    def __init__(self, store: Optional[ProfileStore] = None, weights: Optional[Dict[str, float]] = None):
+        self.store = store if store is not None else ProfileStore()
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        unknown = set(self.weights) - set(TRAITS)
+        if unknown:
+            raise KeyError(f"Unknown trait: {', '.join(sorted(unknown))}")
+
+        # weight -> [(trait, bit offset)]; traits sharing a weight are packed into one uint64 word per row
+        self._groups: Dict[float, List[Tuple[str, int]]] = {}
+        used: Dict[float, int] = {}
+        for name, options in TRAITS.items():
+            w = float(self.weights[name])
+            if not w:
+                continue
+            self._groups.setdefault(w, []).append((name, used.get(w, 0)))
+            used[w] = used.get(w, 0) + len(options)
+        if any(bits > 64 for bits in used.values()):
+            raise ValueError("Trait vocabularies no longer fit a 64-bit feature word")
+        self._group_weights = np.array(list(self._groups), dtype=np.float32)
+        self._features = np.zeros((len(self._groups), 0), dtype=np.uint64)
+        self._sizes = np.zeros(0, dtype=np.float32)
+        self._indexed = 0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _pack(self, codes: Dict[str, np.ndarray]) -> np.ndarray:
+        n = len(next(iter(codes.values())))
+        features = np.zeros((len(self._groups), n), dtype=np.uint64)
+        for g, members in enumerate(self._groups.values()):
+            for name, offset in members:
+                col = codes[name].astype(np.uint64)
+                if name in SINGLE_TRAITS:
+                    known = codes[name] != UNKNOWN_CODES[name]
+                    features[g] |= np.where(known, np.uint64(1) << (col + np.uint64(offset)), np.uint64(0))
+                else:
+                    features[g] |= col << np.uint64(offset)
+        return features
+
+    def _weighted_sizes(self, features: np.ndarray) -> np.ndarray:
+        return (self._group_weights[:, None] * _popcount(features)).sum(axis=0, dtype=np.float32)
+
+    def _sync(self) -> None:
+        # rows appended straight to the store since the last call are packed here
+        n = len(self.store)
+        if self._indexed == n:
+            return
+        if self._features.shape[1] < n:
+            capacity = max(n, self._features.shape[1] * 2)
+            grown = np.zeros((len(self._groups), capacity), dtype=np.uint64)
+            grown[:, :self._indexed] = self._features[:, :self._indexed]
+            self._features = grown
+            sizes = np.zeros(capacity, dtype=np.float32)
+            sizes[:self._indexed] = self._sizes[:self._indexed]
+            self._sizes = sizes
+        fresh = self._pack({name: self.store.column(name)[self._indexed:n] for name in TRAITS})
+        self._features[:, self._indexed:n] = fresh
+        self._sizes[self._indexed:n] = self._weighted_sizes(fresh)
+        self._indexed = n
+
+    def add(self, profile: Dict, customer_id: Optional[str] = None) -> int:
+        return self.add_many([profile], None if customer_id is None else [customer_id])[0]
+
+    def add_many(self, profiles: Iterable[Dict], customer_ids: Optional[Iterable[Optional[str]]] = None) -> List[int]:
+        rows = self.store.extend(profiles, customer_ids)
+        self._sync()
+        return rows
+
+    def _encode_queries(self, profiles: Sequence[Dict]) -> np.ndarray:
+        encoded = [encode_profile(p) for p in profiles]
+        return self._pack({name: np.array([e[name] for e in encoded], dtype=COLUMN_DTYPES[name]) for name in TRAITS})
+
+    def scores(self, profile: Dict) -> np.ndarray:
+        """Similarity of ``profile`` to every stored row."""
+        self._sync()
+        query = self._encode_queries([profile])
+        return self._score_block(query, self._weighted_sizes(query), 0, len(self.store))[0]
+
+    def _score_block(self, query: np.ndarray, query_sizes: np.ndarray, start: int, end: int) -> np.ndarray:
+        inter = np.zeros((query.shape[1], end - start), dtype=np.float32)
+        for g, w in enumerate(self._group_weights):
+            common = _popcount(self._features[g, start:end] & query[g][:, None])
+            if w == 1:
+                inter += common
+            else:
+                inter += w * common
+        union = self._sizes[start:end] + query_sizes[:, None] - inter
+        return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+    def query_batch(self, profiles: Sequence[Dict], k: int = 10,
+                    exclude: Optional[Sequence[Optional[int]]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows and scores per query, best first; shape (len(profiles), k), rows padded with -1.
+
+        ``exclude`` gives one row per query to leave out (e.g. the query's own row), or None.
+        """
+        self._sync()
+        n, n_queries = len(self.store), len(profiles)
+        k = max(0, min(k, n))
+        best_rows = np.full((n_queries, k), -1, dtype=np.int64)
+        best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if not n_queries or not k:
+            return best_rows, best_scores
+
+        query = self._encode_queries(profiles)
+        query_sizes = self._weighted_sizes(query)
+        excluded = np.array([-1 if e is None else e for e in exclude], dtype=np.int64) if exclude is not None else None
+        block = max(k, BLOCK_CELLS // n_queries)
+        for start in range(0, n, block):
+            end = min(n, start + block)
+            scores = self._score_block(query, query_sizes, start, end)
+            if excluded is not None:
+                hit = (excluded >= start) & (excluded < end)
+                scores[np.flatnonzero(hit), excluded[hit] - start] = -np.inf
+            take = min(k, end - start)
+            top = np.argpartition(scores, -take, axis=1)[:, -take:] if take < end - start else \
+                np.broadcast_to(np.arange(end - start), (n_queries, end - start))
+            rows = np.concatenate([best_rows, top + start], axis=1)
+            cand = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            # best score first, then lower row number among the kept candidates
+            order = np.lexsort((np.where(rows < 0, n, rows), -cand), axis=1)[:, :k]
+            best_rows = np.take_along_axis(rows, order, axis=1)
+            best_scores = np.take_along_axis(cand, order, axis=1)
+        best_rows[~np.isfinite(best_scores)] = -1
+        return best_rows, best_scores
+
+    def query(self, profile: Dict, k: int = 10, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        rows, scores = self.query_batch([profile], k, None if exclude is None else [exclude])
+        return [(int(r), float(s)) for r, s in zip(rows[0], scores[0]) if r >= 0]
+
+    def similar_to(self, row: int, k: int = 10) -> List[Tuple[int, float]]:
+        return self.query(self.store.get(row), k, exclude=row)
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import json, os
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from gpt_infer import (
+    AGE_RANGES, GENDER_OPTIONS, HOBBY_OPTIONS, LIFESTYLE_OPTIONS, PERSONALITY_OPTIONS,
+    PROFESSION_OPTIONS, SHOPPING_STYLE_OPTIONS,
+)
+
+# single-choice traits are stored as the option's index, multi-choice traits
+# as a bitmask with bit i set for option i
+SINGLE_TRAITS: Dict[str, List[str]] = {
+    "age": AGE_RANGES,
+    "gender": GENDER_OPTIONS,
+    "profession": PROFESSION_OPTIONS,
+}
+MULTI_TRAITS: Dict[str, List[str]] = {
+    "lifestyle": LIFESTYLE_OPTIONS,
+    "personality": PERSONALITY_OPTIONS,
+    "hobbies": HOBBY_OPTIONS,
+    "shopping_style": SHOPPING_STYLE_OPTIONS,
+}
+TRAITS = {**SINGLE_TRAITS, **MULTI_TRAITS}
+COLUMN_DTYPES = {
+    **{name: np.uint8 for name in SINGLE_TRAITS},
+    **{name: np.uint16 for name in MULTI_TRAITS},
+}
+
+_INDEX = {name: {opt: i for i, opt in enumerate(options)} for name, options in TRAITS.items()}
+_META_FILE = "vocab.json"
+# customer ids as one utf-8 blob plus row offsets into it, not a fixed-width array padded to the longest id
+_ID_OFFSETS_FILE = "customer_id_offsets.npy"
+_ID_BLOB_FILE = "customer_id_blob.npy"
+_LEGACY_IDS_FILE = "customer_id.npy"
+
+Criterion = Union[str, Sequence[str]]
+
+
+def _unknown_code(name: str) -> int:
+    options = SINGLE_TRAITS[name]
+    return options.index("Unknown") if "Unknown" in options else len(options) - 1
+
+
+UNKNOWN_CODES = {name: _unknown_code(name) for name in SINGLE_TRAITS}
+
+
+def encode_trait(name: str, value) -> int:
+    index = _INDEX[name]
+    if name in SINGLE_TRAITS:
+        return index.get(value, _unknown_code(name)) if isinstance(value, str) else _unknown_code(name)
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(",")]
+    bits = 0
+    for v in value or []:
+        if v in index:
+            bits |= 1 << index[v]
+    return bits
+
+
+def decode_trait(name: str, code: int):
+    options = TRAITS[name]
+    if name in SINGLE_TRAITS:
+        return options[code]
+    return [opt for i, opt in enumerate(options) if code >> i & 1]
+
+
+def encode_profile(profile: Dict) -> Dict[str, int]:
+    profile = profile if isinstance(profile, dict) else {}
+    return {name: encode_trait(name, profile.get(name)) for name in TRAITS}
+
+
+def decode_profile(codes: Dict[str, int]) -> Dict:
+    return {name: decode_trait(name, int(codes[name])) for name in TRAITS}
+
+
+class ProfileStore:
+    """Column-per-trait uint8/uint16 arrays: 11 bytes per profile, plus customer ids if any were given."""
+
+    def __init__(self, capacity: int = 1024):
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        # row i's id is _id_blob[_id_offsets[i]:_id_offsets[i + 1]]; None until some row has an id
+        self._id_offsets: Optional[np.ndarray] = None
+        self._id_blob = bytearray()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col[:self._size].nbytes for col in self._columns.values())
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self._size]
+
+    @property
+    def ids(self) -> Optional[List[str]]:
+        if self._id_offsets is None:
+            return None
+        return [self.customer_id(row) for row in range(self._size)]
+
+    def customer_id(self, row: int) -> Optional[str]:
+        if self._id_offsets is None:
+            return None
+        start, end = self._id_offsets[row], self._id_offsets[row + 1]
+        return bytes(self._id_blob[start:end]).decode("utf-8")
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        capacity = len(next(iter(self._columns.values())))
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name, col in self._columns.items():
+            grown = np.zeros(capacity, dtype=col.dtype)
+            grown[:self._size] = col[:self._size]
+            self._columns[name] = grown
+        if self._id_offsets is not None:
+            self._grow_id_offsets(capacity)
+
+    def _grow_id_offsets(self, capacity: int) -> None:
+        if len(self._id_offsets) < capacity + 1:
+            grown = np.zeros(capacity + 1, dtype=np.int64)
+            grown[:self._size + 1] = self._id_offsets[:self._size + 1]
+            self._id_offsets = grown
+
+    def append(self, profile: Dict, customer_id: Optional[str] = None) -> int:
+        return self.extend([profile], [customer_id])[0]
+
+    def extend(self, profiles: Iterable[Dict], customer_ids: Optional[Iterable[Optional[str]]] = None) -> List[int]:
+        profiles = list(profiles)
+        ids = list(customer_ids) if customer_ids is not None else None
+        if ids is not None and len(ids) != len(profiles):
+            raise ValueError("customer_ids must line up with profiles")
+        self._reserve(len(profiles))
+        start = self._size
+        for name in TRAITS:
+            codes = [encode_trait(name, p.get(name) if isinstance(p, dict) else None) for p in profiles]
+            self._columns[name][start:start + len(profiles)] = codes
+        if ids is not None and any(i is not None for i in ids) and self._id_offsets is None:
+            # rows added before the first id get empty ones
+            self._id_offsets = np.zeros(len(next(iter(self._columns.values()))) + 1, dtype=np.int64)
+        if self._id_offsets is not None:
+            end = self._id_offsets[start]
+            for row, i in enumerate(ids or [None] * len(profiles), start + 1):
+                if i is not None:
+                    encoded = str(i).encode("utf-8")
+                    self._id_blob += encoded
+                    end += len(encoded)
+                self._id_offsets[row] = end
+        self._size += len(profiles)
+        return list(range(start, self._size))
+
+    def codes(self, row: int) -> Dict[str, int]:
+        return {name: int(self._columns[name][row]) for name in TRAITS}
+
+    def get(self, row: int) -> Dict:
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return decode_profile(self.codes(row))
+
+    def mask(self, match: str = "all", **criteria: Criterion) -> np.ndarray:
+        """Boolean row mask, e.g. mask(age=["25-34", "35-44"], hobbies=["Gaming", "Reading"]).
+
+        Multi-choice traits need all the given options (match="all") or any of them (match="any").
+        """
+        if match not in ("all", "any"):
+            raise ValueError(f"match must be 'all' or 'any', not {match!r}")
+        keep = np.ones(self._size, dtype=bool)
+        for name, wanted in criteria.items():
+            if name not in TRAITS:
+                raise KeyError(f"Unknown trait: {name}")
+            values = [wanted] if isinstance(wanted, str) else list(wanted)
+            unknown = [v for v in values if v not in _INDEX[name]]
+            if unknown:
+                raise ValueError(f"Not a {name} option: {', '.join(unknown)}")
+            col = self.column(name)
+            if name in SINGLE_TRAITS:
+                keep &= np.isin(col, [_INDEX[name][v] for v in values])
+            else:
+                bits = encode_trait(name, values)
+                keep &= (col & bits) == bits if match == "all" else (col & bits) != 0
+        return keep
+
+    def filter(self, match: str = "all", **criteria: Criterion) -> np.ndarray:
+        return np.flatnonzero(self.mask(match, **criteria))
+
+    def counts(self, name: str) -> Dict[str, int]:
+        col = self.column(name)
+        options = TRAITS[name]
+        if name in SINGLE_TRAITS:
+            tally = np.bincount(col, minlength=len(options))
+        else:
+            tally = [int(np.count_nonzero(col & (1 << i))) for i in range(len(options))]
+        return {opt: int(n) for opt, n in zip(options, tally)}
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in TRAITS:
+            np.save(os.path.join(directory, f"{name}.npy"), self.column(name))
+        for file_name in (_ID_OFFSETS_FILE, _ID_BLOB_FILE, _LEGACY_IDS_FILE):
+            if os.path.exists(os.path.join(directory, file_name)):
+                os.remove(os.path.join(directory, file_name))
+        if self._id_offsets is not None:
+            np.save(os.path.join(directory, _ID_OFFSETS_FILE), self._id_offsets[:self._size + 1])
+            np.save(os.path.join(directory, _ID_BLOB_FILE), np.frombuffer(bytes(self._id_blob), dtype=np.uint8))
+        # the vocabularies go along so a store outlives reordered option lists
+        with open(os.path.join(directory, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"size": self._size, "vocab": TRAITS}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False) -> "ProfileStore":
+        with open(os.path.join(directory, _META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        store = cls(capacity=0)
+        for name in TRAITS:
+            col = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            saved = meta["vocab"].get(name)
+            if saved != TRAITS[name]:
+                col = _remap(name, np.asarray(col), saved or [])
+            store._columns[name] = col if mmap and saved == TRAITS[name] else np.array(col, dtype=COLUMN_DTYPES[name])
+        store._size = meta["size"]
+        offsets_path = os.path.join(directory, _ID_OFFSETS_FILE)
+        legacy_path = os.path.join(directory, _LEGACY_IDS_FILE)
+        if os.path.exists(offsets_path):
+            store._id_offsets = np.load(offsets_path)
+            store._id_blob = bytearray(np.load(os.path.join(directory, _ID_BLOB_FILE)).tobytes())
+        elif os.path.exists(legacy_path):
+            encoded = [i.encode("utf-8") for i in np.load(legacy_path).tolist()]
+            store._id_offsets = np.concatenate([[0], np.cumsum([len(i) for i in encoded], dtype=np.int64)])
+            store._id_blob = bytearray(b"".join(encoded))
+        return store
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> "ProfileStore":
+        """Build a store from batch_profile output, keeping the successfully profiled files."""
+        profiles, ids = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("status") == "ok":
+                    profiles.append(record.get("profile") or {})
+                    ids.append(record.get("file"))
+        store = cls(capacity=max(len(profiles), 1))
+        store.extend(profiles, ids)
+        return store
+
+
+def _remap(name: str, col: np.ndarray, saved: List[str]) -> np.ndarray:
+    if name in SINGLE_TRAITS:
+        table = np.array([_INDEX[name].get(opt, _unknown_code(name)) for opt in saved] or [0], dtype=np.uint8)
+        return table[col]
+    out = np.zeros(len(col), dtype=np.uint16)
+    for i, opt in enumerate(saved):
+        if opt in _INDEX[name]:
+            out |= np.where(col >> i & 1, 1 << _INDEX[name][opt], 0).astype(np.uint16)
+    return out
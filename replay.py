@@ -0,0 +1,269 @@
+"""Record/replay transport for the OpenAI, DuckDuckGo and Unsplash calls (REPLAY_MODE, REPLAY_LATENCY)."""
+from __future__ import annotations
+
+import asyncio, json, os, threading, time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import registry
+from result_cache import content_key
+
+# record: call through and append; replay: archive only, misses raise ReplayMiss; auto: both
+MODES = ("off", "record", "replay", "auto")
+DEFAULT_ARCHIVE = os.path.join(".cache", "replay.jsonl")
+STREAM_CHUNK_CHARS = 16
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+def _provider(url: str) -> str:
+    labels = (urlsplit(url).hostname or "").split(".")
+    return labels[-2] if len(labels) > 1 else labels[0]
+
+
+def parse_latency(spec: Optional[str]) -> Dict[str, Tuple[str, float]]:
+    """'recorded*0.5,unsplash=0.02' -> {'*': ('recorded', 0.5), 'unsplash': ('fixed', 0.02)}"""
+    profile: Dict[str, Tuple[str, float]] = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        provider, _, value = entry.rpartition("=")
+        value = value.strip()
+        if value.startswith("recorded"):
+            scale = value[len("recorded"):].lstrip("*") or "1"
+            profile[provider.strip() or "*"] = ("recorded", float(scale))
+        else:
+            profile[provider.strip() or "*"] = ("fixed", float(value))
+    return profile
+
+
+class _ReplayResponse:
+    """Just enough of requests.Response for the lookups in gpt_infer."""
+
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} replayed error for {self.url}", response=self)
+
+
+class ReplayTransport:
+    def __init__(self, mode: str = "off", archive_path: str = DEFAULT_ARCHIVE, latency: Optional[str] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode: {mode!r} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.archive_path = archive_path
+        self.latency = parse_latency(latency)
+        self._lock = threading.Lock()
+        self._records: Optional[Dict[str, Dict]] = None
+        self._out = None
+
+    @classmethod
+    def from_env(cls) -> "ReplayTransport":
+        return cls(
+            mode=os.getenv("REPLAY_MODE", "off").lower(),
+            archive_path=os.getenv("REPLAY_ARCHIVE", DEFAULT_ARCHIVE),
+            latency=os.getenv("REPLAY_LATENCY"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _archive(self) -> Dict[str, Dict]:
+        if self._records is None:
+            with self._lock:
+                if self._records is None:
+                    records = {}
+                    if os.path.exists(self.archive_path):
+                        with open(self.archive_path, encoding="utf-8") as f:
+                            for line in f:
+                                try:
+                                    record = json.loads(line)
+                                except ValueError:
+                                    continue  # torn last line from an interrupted recording
+                                records[record["key"]] = record
+                    self._records = records
+        return self._records
+
+    def _lookup(self, key: str, provider: str) -> Optional[Dict]:
+        if self.mode not in ("replay", "auto"):
+            return None
+        record = self._archive().get(key)
+        if record is None:
+            registry.inc("replay_misses_total", provider=provider)
+            if self.mode == "replay":
+                raise ReplayMiss(f"No recorded {provider} exchange for key {key[:12]}")
+        else:
+            registry.inc("replay_hits_total", provider=provider)
+        return record
+
+    async def _alookup(self, key: str, provider: str) -> Optional[Dict]:
+        if self._records is None and self.mode in ("replay", "auto"):
+            # the first lookup reads the whole archive; keep that off the event loop
+            await asyncio.to_thread(self._archive)
+        return self._lookup(key, provider)
+
+    def _record(self, record: Dict) -> None:
+        record["recorded_at"] = time.time()
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._out is None:
+                if os.path.dirname(self.archive_path):
+                    os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+                self._out = open(self.archive_path, "a", encoding="utf-8")
+            self._out.write(line)
+            self._out.flush()
+            if self._records is not None:
+                self._records[record["key"]] = record
+
+    def _delay(self, provider: str, recorded_s: float) -> float:
+        kind, value = self.latency.get(provider) or self.latency.get("*") or ("fixed", 0.0)
+        return recorded_s * value if kind == "recorded" else value
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    # -- HTTP lookups -------------------------------------------------------
+
+    def _http_record(self, provider: str, key: str, url: str, params: Optional[Dict], resp, start: float) -> None:
+        self._record({
+            "kind": "http", "provider": provider, "key": key, "latency_s": time.perf_counter() - start,
+            "request": {"url": url, "params": params or {}},
+            "response": {"status": resp.status_code, "text": resp.text},
+        })
+
+    def get(self, send: Callable[[], object], url: str, params: Optional[Dict] = None):
+        """Run ``send`` (the real GET) or serve the recorded response for url+params."""
+        if not self.enabled:
+            return send()
+        provider = _provider(url)
+        key = content_key("GET", url, json.dumps(params or {}, sort_keys=True))
+        record = self._lookup(key, provider)
+        if record is not None:
+            self._sleep(self._delay(provider, record["latency_s"]))
+            return _ReplayResponse(url, record["response"]["status"], record["response"]["text"])
+
+        start = time.perf_counter()
+        resp = send()
+        self._http_record(provider, key, url, params, resp, start)
+        return resp
+
+    async def aget(self, send: Callable[[], Awaitable], url: str, params: Optional[Dict] = None):
+        """get() for an async ``send``."""
+        if not self.enabled:
+            return await send()
+        provider = _provider(url)
+        key = content_key("GET", url, json.dumps(params or {}, sort_keys=True))
+        record = await self._alookup(key, provider)
+        if record is not None:
+            await asyncio.sleep(max(self._delay(provider, record["latency_s"]), 0))
+            return _ReplayResponse(url, record["response"]["status"], record["response"]["text"])
+
+        start = time.perf_counter()
+        resp = await send()
+        await asyncio.to_thread(self._http_record, provider, key, url, params, resp, start)
+        return resp
+
+    # -- chat completions ---------------------------------------------------
+
+    def chat(self, create: Callable[..., object], **kwargs):
+        """Run ``create(**kwargs)`` or replay it; streamed and plain calls share one recording."""
+        if not self.enabled:
+            return create(**kwargs)
+        stream = bool(kwargs.get("stream"))
+        key = _chat_key(kwargs)
+        record = self._lookup(key, "openai")
+        if record is not None:
+            if stream:
+                return self._replay_stream(record)
+            self._sleep(self._delay("openai", record["latency_s"]))
+            return _completion(record["response"]["content"])
+
+        request = {"model": kwargs.get("model")}
+        start = time.perf_counter()
+        if stream:
+            return self._record_stream(create(**kwargs), key, request, start)
+        response = create(**kwargs)
+        self._chat_record(key, request, response, start)
+        return response
+
+    async def achat(self, create: Callable[..., Awaitable], **kwargs):
+        """chat() for an async ``create``; plain (non-streamed) calls only."""
+        if kwargs.get("stream"):
+            raise ValueError("achat does not handle streamed calls")
+        if not self.enabled:
+            return await create(**kwargs)
+        key = _chat_key(kwargs)
+        record = await self._alookup(key, "openai")
+        if record is not None:
+            await asyncio.sleep(max(self._delay("openai", record["latency_s"]), 0))
+            return _completion(record["response"]["content"])
+
+        start = time.perf_counter()
+        response = await create(**kwargs)
+        await asyncio.to_thread(self._chat_record, key, {"model": kwargs.get("model")}, response, start)
+        return response
+
+    def _chat_record(self, key: str, request: Dict, response, start: float) -> None:
+        self._record({
+            "kind": "chat", "provider": "openai", "key": key, "latency_s": time.perf_counter() - start,
+            "request": request,
+            "response": {"content": response.choices[0].message.content, "chunks": None},
+        })
+
+    def _record_stream(self, chunks, key: str, request: Dict, start: float) -> Iterator:
+        timeline: List[Tuple[float, str]] = []
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                timeline.append((time.perf_counter() - start, delta))
+            yield chunk
+        # only complete streams are archived; a broken one raises out of the loop above
+        self._record({
+            "kind": "chat", "provider": "openai", "key": key, "latency_s": time.perf_counter() - start,
+            "request": request,
+            "response": {"content": "".join(d for _, d in timeline), "chunks": timeline},
+        })
+
+    def _replay_stream(self, record: Dict) -> Iterator:
+        content = record["response"]["content"]
+        timeline = record["response"].get("chunks")
+        kind, _ = self.latency.get("openai") or self.latency.get("*") or ("fixed", 0.0)
+        if not timeline:
+            # recorded without streaming: spread the whole-call latency over even chunks
+            pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            step = record["latency_s"] / max(len(pieces), 1)
+            timeline = [(step * (i + 1), p) for i, p in enumerate(pieces)]
+        if kind == "fixed":
+            self._sleep(self._delay("openai", 0.0))
+        previous = 0.0
+        for at, delta in timeline:
+            if kind == "recorded":
+                self._sleep(self._delay("openai", at - previous))
+                previous = at
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+def _chat_key(kwargs: Dict) -> str:
+    return content_key(
+        str(kwargs.get("model")),
+        json.dumps(kwargs.get("messages"), sort_keys=True),
+        json.dumps(kwargs.get("response_format"), sort_keys=True),
+    )
+
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import copy, hashlib, heapq, json, os, threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def content_key(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                return None
+            self._items.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._items[key] = copy.deepcopy(value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskBackend:
+    """One JSON file per key; least recently read/written files are evicted first."""
+
+    def __init__(self, directory: str, max_entries: int = 10_000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # entries on disk, counted once on the first put and kept up to date after
+        self._count: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: Dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        is_new = not os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._count is None:
+                self._count = len(self)
+            elif is_new:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # down to 90% of max_entries, so the scan and sort run once per max_entries/10 inserts
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        overflow = len(entries) - (self.max_entries - self.max_entries // 10)
+        if overflow > 0:
+            for e in heapq.nsmallest(overflow, entries, key=lambda e: e.stat().st_mtime):
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+        self._count = len(entries) - max(overflow, 0)
+
+    def __len__(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(1 for e in os.scandir(self.directory) if e.name.endswith(".json"))
+
+
+class ResultCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict) -> None:
+        self.backend.put(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.backend)}
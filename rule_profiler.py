@@ -0,0 +1,152 @@
+"""Keyword and price-band profiler over clean_order_csv output, run before the LLM to settle what it can."""
+from __future__ import annotations
+
+import re
+import statistics
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from data.prompt_compactor import ORDER_LINE_RE
+
+CONFIDENCE_THRESHOLD = 0.7
+# the traits the keyword and price rules can settle; the rest are left to the LLM, or Unknown on a skip
+RULE_TRAITS = ("lifestyle", "hobbies", "shopping_style")
+# a trait is fully confident once this share of distinct products maps onto it
+TARGET_COVERAGE = 0.4
+# options need this many distinct matching products, or this share of them
+MIN_SUPPORT = 2
+MIN_SHARE = 0.1
+# priced orders needed for full confidence in the price-band styles
+CONFIDENT_PRICED_ORDERS = 20
+
+BUDGET_MEDIAN = 15.0
+PREMIUM_PRICE = 100.0
+PREMIUM_SHARE = 0.25
+BRAND_LOYAL_SHARE = 0.3
+BRAND_LOYAL_ORDERS = 5
+
+KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "hobbies": {
+        "Reading": ["kindle", "novel", "paperback", "hardcover", "book", "bookmark", "reading light"],
+        "Gaming": ["nintendo", "switch", "playstation", "ps5", "xbox", "controller", "gaming", "steam deck", "board game", "catan"],
+        "Cooking": ["mixer", "instant pot", "pressure cooker", "skillet", "cast iron", "cookware", "knife", "cutting board",
+                    "air fryer", "spatula", "baking", "dutch oven", "blender", "saucepan"],
+        "Sports": ["basketball", "soccer", "tennis", "golf", "baseball", "football", "racket", "pickleball"],
+        "Traveling": ["luggage", "suitcase", "travel", "passport", "packing cubes", "neck pillow", "backpack"],
+        "Music": ["guitar", "ukulele", "keyboard piano", "microphone", "headphones", "earbuds", "speaker", "vinyl", "turntable"],
+        "Movies/TV": ["fire tv", "roku", "chromecast", "blu-ray", "dvd", "projector", "soundbar"],
+        "Art/Crafts": ["paint", "watercolor", "acrylic", "canvas", "sketch", "crayola", "yarn", "knitting", "sewing", "brush set"],
+        "Gardening": ["pruning", "potting", "seeds", "garden", "planter", "hose", "fertilizer", "miracle-gro", "trowel"],
+        "Tech/Coding": ["raspberry pi", "arduino", "ssd", "usb-c", "usb c", "hub", "mouse", "mechanical keyboard", "monitor", "router"],
+        "Fitness": ["foam roller", "yoga", "dumbbell", "kettlebell", "resistance band", "protein", "fitbit", "treadmill",
+                    "jump rope", "gym", "whey"],
+        "Writing": ["notebook", "moleskine", "journal", "gel pen", "fountain pen", "pens", "planner"],
+    },
+    "lifestyle": {
+        "Active": ["running", "hiking", "bike", "cycling", "yoga", "dumbbell", "foam roller", "fitbit", "sneakers"],
+        "Homebody": ["blanket", "slippers", "candle", "throw pillow", "coffee maker", "robe", "lounge"],
+        "Tech-focused": ["echo", "alexa", "nest", "smart", "airtag", "philips hue", "ssd", "raspberry pi", "charger", "usb"],
+        "Academic": ["textbook", "calculator", "highlighter", "study", "notebook", "flashcards"],
+        "Social": ["party", "board game", "catan", "wine glasses", "gift", "cards against", "serving"],
+        "Outdoorsy": ["tent", "camping", "hiking", "sleeping bag", "lantern", "osprey", "coleman", "patagonia", "trail"],
+        "Minimalist": ["capsule", "minimalist", "organizer", "storage bin", "declutter"],
+        "Family-oriented": ["baby", "diaper", "toddler", "kids", "crayola", "stroller", "lunch box", "family"],
+        "Health-conscious": ["vitamin", "protein", "organic", "supplement", "water bottle", "hydro flask", "nalgene",
+                             "toothbrush", "air purifier"],
+    },
+    "shopping_style": {
+        "Eco-conscious": ["reusable", "bamboo", "compostable", "organic", "recycled", "biodegradable", "refill"],
+    },
+}
+
+# one alternation, longest keywords first so "foam roller" beats a shorter keyword at the same spot
+_KEYWORD_INDEX: Dict[str, List[Tuple[str, str]]] = {}
+for _trait, _options in KEYWORDS.items():
+    for _option, _words in _options.items():
+        for _word in _words:
+            _KEYWORD_INDEX.setdefault(_word, []).append((_trait, _option))
+_KEYWORD_RE = re.compile(
+    r"\b(" + "|".join(re.escape(w) for w in sorted(_KEYWORD_INDEX, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def _parse(cleaned_prompt: str) -> List[Tuple[str, float]]:
+    orders = []
+    for line in cleaned_prompt.splitlines():
+        m = ORDER_LINE_RE.match(line)
+        if m:
+            orders.append((m.group(2), float(m.group(3))))
+    return orders
+
+
+def _price_styles(prices: List[float], products: List[str]) -> Tuple[List[str], float]:
+    priced = [p for p in prices if p > 0]
+    styles = []
+    if priced:
+        if statistics.median(priced) <= BUDGET_MEDIAN:
+            styles.append("Budget-conscious")
+        if sum(p >= PREMIUM_PRICE for p in priced) / len(priced) >= PREMIUM_SHARE:
+            styles.append("Quality-focused")
+    brands = Counter(w for w in (name.split()[0].casefold() for name in products if name.split()) if w not in ("the", "a", "an"))
+    if brands:
+        brand, count = brands.most_common(1)[0]
+        if count >= BRAND_LOYAL_ORDERS and count / len(products) >= BRAND_LOYAL_SHARE:
+            styles.append("Brand-loyal")
+    return styles, min(1.0, len(priced) / CONFIDENT_PRICED_ORDERS)
+
+
+def provisional_profile(cleaned_prompt: str) -> Dict:
+    """{"profile", "confidence" (per trait, 0-1), "evidence" (option -> products), "orders"}"""
+    orders = _parse(cleaned_prompt)
+    products = list(dict.fromkeys(name for name, _ in orders))
+    support: Dict[str, Counter] = {trait: Counter() for trait in KEYWORDS}
+    covered: Dict[str, set] = {trait: set() for trait in KEYWORDS}
+    evidence: Dict[str, List[str]] = {}
+    for name in products:
+        for keyword in {m.casefold() for m in _KEYWORD_RE.findall(name)}:
+            for trait, option in _KEYWORD_INDEX[keyword]:
+                if name not in evidence.setdefault(option, []):
+                    support[trait][option] += 1
+                    evidence[option].append(name)
+                covered[trait].add(name)
+
+    profile: Dict[str, List[str]] = {}
+    confidence: Dict[str, float] = {}
+    for trait in ("lifestyle", "hobbies"):
+        picked = [opt for opt, n in support[trait].most_common()
+                  if n >= MIN_SUPPORT or (products and n / len(products) >= MIN_SHARE)]
+        profile[trait] = picked
+        confidence[trait] = min(1.0, len(covered[trait]) / (TARGET_COVERAGE * len(products))) if products else 0.0
+
+    styles, price_confidence = _price_styles([p for _, p in orders], [name for name, _ in orders])
+    styles += [opt for opt, n in support["shopping_style"].most_common() if n >= MIN_SUPPORT]
+    profile["shopping_style"] = styles
+    confidence["shopping_style"] = price_confidence
+    return {"profile": profile, "confidence": confidence, "evidence": evidence, "orders": len(orders)}
+
+
+def plan(provisional: Dict, threshold: float = CONFIDENCE_THRESHOLD) -> Tuple[str, List[str]]:
+    """("skip", []) when every rule trait clears ``threshold``, else ("fill", the rule traits it didn't settle)."""
+    gaps = [trait for trait in RULE_TRAITS
+            if provisional["confidence"].get(trait, 0.0) < threshold or not provisional["profile"].get(trait)]
+    return ("skip" if not gaps else "fill"), gaps
+
+
+def profile_with_rules(cleaned_prompt: str, threshold: float = CONFIDENCE_THRESHOLD, allow_skip: bool = True,
+                       use_cache: bool = True, provisional: Optional[Dict] = None) -> Dict:
+    """infer_user_profile asked only for what the confident rule traits leave open, or skipped if they settle all.
+
+    ``provisional`` is the rule pass if it already ran, e.g. on the lines before compact_prompt.
+    """
+    from gpt_infer import _validate_profile, infer_user_profile
+
+    if provisional is None:
+        provisional = provisional_profile(cleaned_prompt)
+    decision, gaps = plan(provisional, threshold)
+    known = {trait: values for trait, values in provisional["profile"].items() if trait not in gaps}
+    if decision == "skip" and allow_skip:
+        return {"profile": _validate_profile(known), "recommendations": [],
+                "provisional": {**provisional, "llm": "skipped"}}
+    data = infer_user_profile(cleaned_prompt, use_cache=use_cache, known_traits=known or None)
+    return {**data, "provisional": {**provisional, "llm": "filled" if known else "full"}}
@@ -0,0 +1,224 @@
+"""Shared front door for the DuckDuckGo and Unsplash lookups: identical in-flight GETs share one call, per-provider token buckets."""
+from __future__ import annotations
+
+import asyncio, json, os, threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from metrics import registry
+from replay import _provider
+from result_cache import content_key
+
+# provider=rate[:burst] in requests per second; 0 or off leaves a provider unlimited
+DEFAULT_RATE_LIMITS = "duckduckgo=2:10,unsplash=5:20"
+
+
+class RateLimited(RuntimeError):
+    pass
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    """'duckduckgo=1:5,unsplash=0.5' -> {'duckduckgo': (1.0, 5.0), 'unsplash': (0.5, 1.0)}"""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        provider, _, value = entry.partition("=")
+        if value.strip().lower() in ("", "0", "off"):
+            continue
+        rate, _, burst = value.partition(":")
+        rate = float(rate)
+        limits[provider.strip()] = (rate, float(burst) if burst else max(1.0, rate))
+    return limits
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``. reserve() hands out tokens in arrival order."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> float:
+        """Take a token and return how long to wait before using it (0 if one was free)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            # the balance may go negative: later callers then queue behind earlier reservations
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                raise RateLimited(f"would wait {wait:.1f} s for a token")
+            self._tokens -= 1
+            return wait
+
+
+class _LeaderCancelled(Exception):
+    """Set on a shared async call whose leader was cancelled, so a follower runs the lookup instead."""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class LookupScheduler:
+    def __init__(self, limits: Optional[str] = DEFAULT_RATE_LIMITS, max_wait: Optional[float] = None):
+        self.limits = parse_limits(limits)
+        self.max_wait = max_wait
+        self._buckets = {provider: TokenBucket(rate, burst) for provider, (rate, burst) in self.limits.items()}
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._acalls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._requests: Dict[str, int] = defaultdict(int)
+        self._coalesced: Dict[str, int] = defaultdict(int)
+        self._queued: Dict[str, int] = defaultdict(int)
+        self._max_queued: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._waited: Dict[str, float] = defaultdict(float)
+
+    @classmethod
+    def from_env(cls) -> "LookupScheduler":
+        """LOOKUP_RATE_LIMITS, and LOOKUP_MAX_WAIT seconds before a queued call gives up with RateLimited."""
+        max_wait = os.getenv("LOOKUP_MAX_WAIT")
+        return cls(
+            limits=os.getenv("LOOKUP_RATE_LIMITS", DEFAULT_RATE_LIMITS),
+            max_wait=float(max_wait) if max_wait else None,
+        )
+
+    # -- bookkeeping ----------------------------------------------------------
+
+    def _adjust(self, table: Dict[str, int], gauge: str, provider: str, delta: int) -> None:
+        with self._lock:
+            table[provider] += delta
+            value = table[provider]
+            if table is self._queued:
+                self._max_queued[provider] = max(self._max_queued[provider], value)
+        registry.set_gauge(gauge, value, provider=provider)
+
+    @contextmanager
+    def _tracked(self, table: Dict[str, int], gauge: str, provider: str) -> Iterator[None]:
+        self._adjust(table, gauge, provider, 1)
+        try:
+            yield
+        finally:
+            self._adjust(table, gauge, provider, -1)
+
+    def _reserve(self, provider: str) -> float:
+        bucket = self._buckets.get(provider)
+        wait = bucket.reserve(self.max_wait) if bucket is not None else 0.0
+        registry.observe("lookup_wait_seconds", wait, provider=provider)
+        with self._lock:
+            self._requests[provider] += 1
+            self._waited[provider] += wait
+        return wait
+
+    def _joined(self, provider: str) -> None:
+        registry.inc("lookup_coalesced_total", provider=provider)
+        with self._lock:
+            self._coalesced[provider] += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            providers = set(self._requests) | set(self._coalesced) | set(self.limits)
+            return {
+                p: {
+                    "requests": self._requests.get(p, 0),
+                    "coalesced": self._coalesced.get(p, 0),
+                    "queued": self._queued.get(p, 0),
+                    "max_queued": self._max_queued.get(p, 0),
+                    "in_flight": self._in_flight.get(p, 0),
+                    "waited_s": self._waited.get(p, 0.0),
+                    "rate": self.limits.get(p, (0.0, 0.0))[0],
+                }
+                for p in sorted(providers)
+            }
+
+    # -- calls ----------------------------------------------------------------
+
+    @staticmethod
+    def _key(url: str, params: Optional[Dict]) -> str:
+        return content_key("GET", url, json.dumps(params or {}, sort_keys=True))
+
+    def get(self, url: str, params: Optional[Dict], send: Callable[[], object]):
+        """Run ``send`` (the GET for url+params) once per overlapping group of callers, within the rate limit."""
+        provider, key = _provider(url), self._key(url, params)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self._joined(provider)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._tracked(self._queued, "lookup_queue_depth", provider):
+                wait = self._reserve(provider)
+                if wait:
+                    time.sleep(wait)
+            with self._tracked(self._in_flight, "lookup_in_flight", provider):
+                call.result = send()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def aget(self, url: str, params: Optional[Dict], send: Callable[[], Awaitable]):
+        """get() for an async ``send``; callers are coalesced per event loop."""
+        provider = _provider(url)
+        key = (id(asyncio.get_running_loop()), self._key(url, params))
+        joined = False
+        while True:
+            call = self._acalls.get(key)
+            if call is None:
+                break
+            if not joined:
+                self._joined(provider)
+                joined = True
+            try:
+                return await asyncio.shield(call)
+            except _LeaderCancelled:
+                # the leader's caller gave up, not this one: the first follower back takes over
+                continue
+
+        call = self._acalls[key] = asyncio.get_running_loop().create_future()
+        try:
+            with self._tracked(self._queued, "lookup_queue_depth", provider):
+                wait = self._reserve(provider)
+                if wait:
+                    await asyncio.sleep(wait)
+            with self._tracked(self._in_flight, "lookup_in_flight", provider):
+                result = await send()
+            call.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # cancelling the shared future would cancel every follower along with the leader
+            call.set_exception(_LeaderCancelled())
+            call.exception()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            # followers get the error; don't warn about it when there were none
+            call.exception()
+            raise
+        finally:
+            del self._acalls[key]
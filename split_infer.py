@@ -0,0 +1,151 @@
+"""Profile and recommendations as two smaller LLM calls, so the profile arrives first; optionally hedged."""
+from __future__ import annotations
+
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional
+
+from gpt_infer import (
+    ENRICH_WORKERS, MODEL, _PROFILE_EXAMPLE, _PROFILE_SPEC, _RECS_SPEC, _RecEnricher, _chat, _env,
+    _get_result_cache, _parse_reply, _validate_profile, replay_events,
+)
+from metrics import registry, span
+from result_cache import content_key
+
+MODES = ("parallel", "conditioned")
+
+PROFILE_SYSTEM_PROMPT = f"""
+Generate a JSON output with a 'profile' key from Amazon order summaries.
+{_PROFILE_SPEC}
+Response MUST be compact JSON. Do not repeat input summaries.
+{_PROFILE_EXAMPLE}"""
+
+RECS_SYSTEM_PROMPT = f"""
+Generate a JSON output with a 'recommendations' key from Amazon order summaries.
+{_RECS_SPEC}
+If the user message starts with the shopper's inferred 'profile', suit the items to it as well as to the orders.
+Response MUST be compact JSON. Do not repeat input summaries.
+"""
+
+
+def mode_from_env() -> Optional[str]:
+    """LLM_SPLIT: off, parallel (recommendations from the orders alone) or conditioned (given the profile)."""
+    mode = _env("LLM_SPLIT", "off").lower()
+    return mode if mode in MODES else None
+
+
+def hedge_after_from_env() -> Optional[float]:
+    """LLM_HEDGE_AFTER: seconds before a call that hasn't answered is sent again; the first good reply wins."""
+    value = _env("LLM_HEDGE_AFTER")
+    return float(value) if value else None
+
+
+def _hedged(call: Callable[[], str], hedge_after: Optional[float], path: str) -> str:
+    if not hedge_after:
+        return call()
+    pool = ThreadPoolExecutor(max_workers=2)
+    try:
+        pending = {pool.submit(call)}
+        hedged = False
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else hedge_after, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    return fut.result()
+                error = fut.exception()
+            if not hedged:
+                registry.inc("llm_hedges_total", path=path)
+                pending.add(pool.submit(call))
+                hedged = True
+        raise error
+    finally:
+        # the slower copy can't be cancelled mid-request; it finishes in the background
+        pool.shutdown(wait=False)
+
+
+def _complete(path: str, system_prompt: str, user_content: str, hedge_after: Optional[float]) -> str:
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]
+
+    def call() -> str:
+        response = _chat(model=MODEL, messages=messages, response_format={"type": "json_object"})
+        return response.choices[0].message.content.strip()
+
+    with span("llm_call", path=path):
+        return _hedged(call, hedge_after, path)
+
+
+def _recs_prompt(cleaned_prompt: str, profile: Optional[Dict]) -> str:
+    if profile is None:
+        return cleaned_prompt
+    return f"{json.dumps({'profile': profile}, separators=(',', ':'))}\nOrders:\n{cleaned_prompt}"
+
+
+def _failure(e: Exception) -> Dict:
+    return {"raw_response": "", "error": f"OpenAI API call failed: {str(e)}", "profile": {}, "recommendations": []}
+
+
+def stream_user_profile_split(cleaned_prompt: str, mode: str = "parallel", hedge_after: Optional[float] = None,
+                              use_cache: bool = True) -> Iterator[Dict]:
+    """stream_user_profile's events, from a profile call and a recommendations call."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown split mode: {mode!r} (expected one of {', '.join(MODES)})")
+    cache_key = content_key(cleaned_prompt, PROFILE_SYSTEM_PROMPT, RECS_SYSTEM_PROMPT, MODEL, mode)
+    if use_cache:
+        cached = _get_result_cache().get(cache_key)
+        if cached is not None:
+            yield from replay_events(cached)
+            return
+
+    llm_pool = ThreadPoolExecutor(max_workers=2)
+    enrich_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS)
+    try:
+        profile_future = llm_pool.submit(_complete, "profile", PROFILE_SYSTEM_PROMPT, cleaned_prompt, hedge_after)
+        recs_future = None
+        if mode == "parallel":
+            recs_future = llm_pool.submit(_complete, "recommendations", RECS_SYSTEM_PROMPT, cleaned_prompt, hedge_after)
+
+        try:
+            data = _parse_reply(profile_future.result())
+        except Exception as e:
+            data = _failure(e)
+        if "error" in data:
+            yield from replay_events(data)
+            return
+        profile = _validate_profile(data.get("profile"))
+        yield {"event": "profile", "profile": profile}
+
+        if recs_future is None:
+            recs_future = llm_pool.submit(_complete, "recommendations", RECS_SYSTEM_PROMPT,
+                                          _recs_prompt(cleaned_prompt, profile), hedge_after)
+        try:
+            recs_data = _parse_reply(recs_future.result())
+        except Exception as e:
+            recs_data = _failure(e)
+        if "error" in recs_data:
+            # the profile stands on its own; the cards are left empty and the result isn't cached
+            yield {"event": "done", "data": {"profile": profile, "recommendations": [],
+                                             "recommendations_error": recs_data["error"]}}
+            return
+
+        recs = recs_data.get("recommendations", [])
+        enricher = _RecEnricher(enrich_pool)
+        for r_item in recs if isinstance(recs, list) else []:
+            if isinstance(r_item, dict):
+                enricher.add(r_item)
+        yield from enricher.drain(final=True)
+    finally:
+        llm_pool.shutdown(wait=False)
+        enrich_pool.shutdown(wait=False)
+
+    result = {"profile": profile, "recommendations": enricher.items}
+    if use_cache:
+        _get_result_cache().put(cache_key, result)
+    yield {"event": "done", "data": result}
+
+
+def infer_user_profile_split(cleaned_prompt: str, mode: str = "parallel", hedge_after: Optional[float] = None,
+                             use_cache: bool = True) -> Dict:
+    """infer_user_profile's result, from a profile call and a recommendations call."""
+    events = stream_user_profile_split(cleaned_prompt, mode, hedge_after, use_cache)
+    return next(event["data"] for event in events if event["event"] == "done")
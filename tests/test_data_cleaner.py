@@ -0,0 +1,44 @@
+import io
+
+import pandas as pd
+import pytest
+
+from data.data_cleaner import clean_order_csv, iter_order_lines
+
+FAKE_DATA = "data/fake_data.csv"
+
+
+@pytest.fixture(scope="module")
+def shuffled_csv(tmp_path_factory):
+    from data.synth_orders import generate_orders_csv
+
+    path = tmp_path_factory.mktemp("orders") / "orders.csv"
+    generate_orders_csv(str(path), 5_000, seed=3)
+    pd.read_csv(path).sample(frac=1, random_state=0).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 17, 1_000])
+def test_streaming_matches_full_clean_on_unsorted_export(chunksize):
+    assert list(iter_order_lines(FAKE_DATA, chunksize)) == clean_order_csv(FAKE_DATA).splitlines()
+
+
+@pytest.mark.parametrize("chunksize", [7, 999, 10_000])
+def test_streaming_matches_full_clean_on_shuffled_synthetic_export(shuffled_csv, chunksize):
+    assert list(iter_order_lines(shuffled_csv, chunksize)) == clean_order_csv(shuffled_csv).splitlines()
+
+
+def test_streaming_accepts_file_objects():
+    with open(FAKE_DATA, "rb") as f:
+        data = f.read()
+    assert list(iter_order_lines(io.BytesIO(data), 5)) == clean_order_csv(io.BytesIO(data)).splitlines()
+
+
+def test_non_numeric_unit_price_reads_as_zero():
+    csv = (
+        "Order Date,Product Name,Shipping Address,Unit Price\n"
+        "2025-01-01T10:00:00Z,Mug,12 Elm St Springfield IL 62704,n/a\n"
+        "2025-03-01T10:00:00Z,Lamp,12 Elm St Springfield IL 62704,19.5\n"
+    )
+    lines = clean_order_csv(io.StringIO(csv)).splitlines()
+    assert [line.split(" - ")[1] for line in lines] == ["$0.00", "$19.50"]
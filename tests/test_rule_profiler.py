@@ -0,0 +1,78 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import gpt_infer
+from result_cache import MemoryBackend, ResultCache
+from rule_profiler import plan, profile_with_rules, provisional_profile
+
+CONFIDENT_PRODUCTS = [
+    "Yoga Mat", "Adjustable Dumbbell Set", "Foam Roller", "Resistance Band Kit",
+    "Kindle Paperwhite", "Paperback Novel", "Reusable Bamboo Straws", "Hiking Backpack",
+]
+
+
+def _orders(products, price=12.0, repeat=3):
+    return "\n".join(
+        f"2025-01-{day:02d}: {name} - ${price:.2f} - shipped to Maple St Springfield IL 62704"
+        for day, name in enumerate((n for _ in range(repeat) for n in products), 1)
+    )
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+    reply = {"profile": {"age": "25-34", "gender": "Female", "profession": "Employed", "personality": ["Organized"],
+                         "hobbies": ["Gaming"]},
+             "recommendations": []}
+
+    def chat(**kwargs):
+        calls.append(kwargs["messages"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))])
+
+    monkeypatch.setattr(gpt_infer, "_chat", chat)
+    monkeypatch.setattr(gpt_infer, "_result_cache", ResultCache(MemoryBackend()))
+    return calls
+
+
+def test_confident_rule_profile_skips_the_llm(llm):
+    prompt = _orders(CONFIDENT_PRODUCTS)
+    assert plan(provisional_profile(prompt)) == ("skip", [])
+
+    result = profile_with_rules(prompt)
+
+    assert llm == []
+    assert result["provisional"]["llm"] == "skipped"
+    assert "Fitness" in result["profile"]["hobbies"]
+    assert "Budget-conscious" in result["profile"]["shopping_style"]
+    assert result["profile"]["age"] == "Unknown"
+
+
+def test_fill_asks_only_for_the_traits_left_open(llm):
+    # a few orders: lifestyle and hobbies are settled, the price-band styles aren't
+    prompt = _orders(CONFIDENT_PRODUCTS[:4], repeat=1)
+    decision, gaps = plan(provisional_profile(prompt))
+    assert (decision, gaps) == ("fill", ["shopping_style"])
+
+    result = profile_with_rules(prompt)
+
+    system_prompt = llm[0][0]["content"]
+    assert "'shopping_style' (LIST" in system_prompt and "'age' (ONE" in system_prompt
+    assert "'hobbies' (LIST" not in system_prompt and "'lifestyle' (LIST" not in system_prompt
+    assert len(system_prompt) < len(gpt_infer.SYSTEM_PROMPT)
+    assert result["provisional"]["llm"] == "filled"
+    assert result["profile"]["hobbies"][0] == "Fitness"
+    assert result["profile"]["age"] == "25-34"
+
+
+def test_fill_is_answered_by_a_cached_full_profile(llm):
+    prompt = _orders(CONFIDENT_PRODUCTS[:4], repeat=1)
+    full = gpt_infer.infer_user_profile(prompt)
+    assert len(llm) == 1
+
+    result = profile_with_rules(prompt)
+
+    assert len(llm) == 1
+    assert result["profile"]["age"] == full["profile"]["age"]
+    assert result["profile"]["hobbies"][0] == "Fitness"
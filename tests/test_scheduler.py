@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import LookupScheduler
+
+URL = "https://api.unsplash.com/search/photos"
+
+
+def test_concurrent_identical_gets_share_one_call():
+    scheduler = LookupScheduler(limits=None)
+    calls = []
+    started = threading.Event()
+
+    def send():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "photo"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(scheduler.get(URL, {"query": "mug"}, send)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(scheduler.get(URL, {"query": "mug"}, send)))
+                 for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert results == ["photo"] * 4
+    assert len(calls) == 1
+    assert scheduler.stats()["unsplash"]["coalesced"] == 3
+
+
+def test_concurrent_identical_agets_share_one_call():
+    scheduler = LookupScheduler(limits=None)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "photo"
+
+    async def run():
+        return await asyncio.gather(*(scheduler.aget(URL, {"query": "mug"}, send) for _ in range(4)))
+
+    assert asyncio.run(run()) == ["photo"] * 4
+    assert len(calls) == 1
+    assert scheduler.stats()["unsplash"]["coalesced"] == 3
+
+
+def test_cancelled_leader_hands_the_lookup_to_a_follower():
+    scheduler = LookupScheduler(limits=None)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "photo"
+
+    async def run():
+        leader = asyncio.ensure_future(asyncio.wait_for(scheduler.aget(URL, None, send), timeout=0.02))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(scheduler.aget(URL, None, send)) for _ in range(2)]
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(run()) == ["photo", "photo"]
+    # the leader's call, then one more from the follower that took over
+    assert len(calls) == 2
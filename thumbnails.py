@@ -0,0 +1,244 @@
+"""Recommendation thumbnails downloaded in the background, shrunk to card size and kept on disk."""
+from __future__ import annotations
+
+import base64, hashlib, io, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+from result_cache import content_key
+
+DEFAULT_THUMB_DIR = os.path.join(".cache", "thumbs")
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+CARD_SIZE: Tuple[int, int] = (90, 90)
+JPEG_QUALITY = 85
+MAX_SOURCE_BYTES = 5 * 1024 * 1024
+# a failed download isn't retried for this long, so a broken link doesn't cost a request per page view
+RETRY_FAILED_AFTER = 300.0
+MAX_FAILED = 1024
+PREFETCH_WORKERS = 4
+_INDEX_FILE = "index.json"
+
+# drawn locally instead of fetching the via.placeholder.com image
+PLACEHOLDER_SRC = "data:image/svg+xml;base64," + base64.b64encode(
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="90" height="90" viewBox="0 0 90 90">'
+    b'<rect width="90" height="90" fill="#eeeeee"/>'
+    b'<text x="45" y="49" font-family="sans-serif" font-size="10" fill="#888888" text-anchor="middle">No Image</text>'
+    b'</svg>'
+).decode("ascii")
+
+
+def resize(data: bytes, size: Tuple[int, int] = CARD_SIZE) -> bytes:
+    """Fit the image inside ``size`` (keeping its aspect ratio, like the card's object-fit: contain) as JPEG."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+class ThumbnailCache:
+    def __init__(self, directory: str = DEFAULT_THUMB_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 size: Tuple[int, int] = CARD_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, str]] = None
+        # url -> monotonic time of its last failed download, oldest first
+        self._failed: Dict[str, float] = {}
+        self._pending: Set[str] = set()
+        # bytes of thumbnails on disk, counted once on the first put and kept up to date after
+        self._bytes: Optional[int] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def _url_key(self, url: str) -> str:
+        return content_key(url, f"{self.size[0]}x{self.size[1]}")
+
+    def _load_index(self) -> Dict[str, str]:
+        if self._index is None:
+            try:
+                with open(os.path.join(self.directory, _INDEX_FILE), encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self) -> None:
+        path = os.path.join(self.directory, _INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, path)
+
+    def path(self, url: str) -> Optional[str]:
+        """Local file holding the thumbnail for ``url``, or None if it isn't cached."""
+        with self._lock:
+            digest = self._load_index().get(self._url_key(url))
+        if digest is None:
+            return None
+        path = self._path(digest)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def cached(self, url: str) -> Optional[bytes]:
+        """Thumbnail bytes for ``url`` if they're already on disk; never downloads."""
+        if not url:
+            return None
+        path = self.path(url)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Thumbnail bytes for ``url``, downloading and resizing them on the first call."""
+        if not url or not url.startswith(("http://", "https://")):
+            return None
+        data = self.cached(url)
+        if data is not None or self._recently_failed(url):
+            return data
+        try:
+            data = resize(self._download(url), self.size)
+        except Exception:
+            self._mark_failed(url)
+            return None
+        self._put(url, data)
+        return data
+
+    def prefetch(self, url: str) -> None:
+        """Start downloading ``url`` on a background thread unless it's cached, in flight or recently failed."""
+        if not url or not url.startswith(("http://", "https://")) or self._recently_failed(url):
+            return
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="thumbnail")
+        self._pool.submit(self.get, url).add_done_callback(lambda _: self._pending.discard(url))
+
+    def _recently_failed(self, url: str) -> bool:
+        with self._lock:
+            failed_at = self._failed.get(url)
+            if failed_at is None:
+                return False
+            if time.monotonic() - failed_at < RETRY_FAILED_AFTER:
+                return True
+            del self._failed[url]
+            return False
+
+    def _mark_failed(self, url: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._failed.pop(url, None)
+            self._failed[url] = now
+            if len(self._failed) > MAX_FAILED:
+                self._failed = {u: t for u, t in self._failed.items() if now - t < RETRY_FAILED_AFTER}
+                # still over with only fresh failures: forget the oldest
+                for stale in list(self._failed)[:len(self._failed) - MAX_FAILED]:
+                    del self._failed[stale]
+
+    def _download(self, url: str) -> bytes:
+        from http_pool import http
+
+        resp = http.get(url, timeout=5, stream=True)
+        try:
+            resp.raise_for_status()
+            data = resp.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        finally:
+            resp.close()
+        if len(data) > MAX_SOURCE_BYTES:
+            raise ValueError(f"Image larger than {MAX_SOURCE_BYTES} bytes: {url}")
+        return data
+
+    def _put(self, url: str, data: bytes) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(digest)
+        is_new = not os.path.exists(path)
+        if is_new:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._load_index()[self._url_key(url)] = digest
+            if self._bytes is None:
+                self._bytes = self.stats()["bytes"]
+            elif is_new:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._save_index()
+
+    def _evict(self) -> None:
+        # down to 90% of max_bytes, so the scan and sort run once per max_bytes/10 of new thumbnails
+        entries = [(e, e.stat()) for e in os.scandir(self.directory) if e.name.endswith(".jpg")]
+        total = sum(st.st_size for _, st in entries)
+        target = self.max_bytes - self.max_bytes // 10
+        removed = set()
+        if total > target:
+            entries.sort(key=lambda entry: entry[1].st_mtime)
+            for e, st in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    continue
+                total -= st.st_size
+                removed.add(e.name[:-len(".jpg")])
+            self._index = {k: v for k, v in self._index.items() if v not in removed}
+        self._bytes = total
+
+    def data_uri(self, url: str) -> Optional[str]:
+        """The cached thumbnail as a data: URI; None (with a download started) when it isn't cached yet."""
+        data = self.cached(url)
+        if data is None:
+            self.prefetch(url)
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii") if data is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        if not os.path.isdir(self.directory):
+            return {"files": 0, "bytes": 0}
+        sizes = [e.stat().st_size for e in os.scandir(self.directory) if e.name.endswith(".jpg")]
+        return {"files": len(sizes), "bytes": sum(sizes)}
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ThumbnailCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache(
+                    directory=os.getenv("THUMB_CACHE_DIR", DEFAULT_THUMB_DIR),
+                    max_bytes=int(os.getenv("THUMB_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+                )
+    return _cache
+
+
+def card_src(img_url: Optional[str], placeholder_url: Optional[str] = None) -> str:
+    """What to put in a card's <img src>: the cached thumbnail inline, the drawn placeholder, or the URL itself.
+
+    Never downloads on the calling (script) thread; an uncached image shows from its URL until the cache has it.
+    """
+    if not img_url or img_url == placeholder_url:
+        return PLACEHOLDER_SRC
+    return get_cache().data_uri(img_url) or img_url
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import io
+from functools import lru_cache
+from typing import Dict, Tuple
+
+CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _render(frequencies: Tuple[Tuple[str, float], ...], options: Tuple[Tuple[str, object], ...]) -> bytes:
+    from wordcloud import WordCloud
+
+    # fixed random_state keeps the layout (and so the cached bytes) stable across reruns
+    wc = WordCloud(random_state=0, **dict(options))
+    wc.generate_from_frequencies(dict(frequencies))
+    buf = io.BytesIO()
+    wc.to_image().save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def render_word_cloud_png(frequencies: Dict[str, float], width: int = 800, height: int = 400,
+                          background_color: str = "white", colormap: str = "viridis",
+                          min_font_size: int = 10, **options) -> bytes:
+    """Keyword -> weight dict to PNG bytes, straight from WordCloud's PIL image (no matplotlib)."""
+    options.update(width=width, height=height, background_color=background_color,
+                   colormap=colormap, min_font_size=min_font_size)
+    return _render(tuple(sorted(frequencies.items())), tuple(sorted(options.items())))
+
+
+def cache_info():
+    return _render.cache_info()
+
+
+def cache_clear() -> None:
+    _render.cache_clear()